@@ -0,0 +1,125 @@
+"""Compare the dict based hit map with HitStore on synthetic /files hits.
+
+Usage: PYTHONPATH=. python benchmarks/hit_store.py [--hits 100000] [--samples 3]
+
+Times parsing the hits, building the lookup structure and checking for
+missing ids, and reports the memory held by the result.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+
+from gdc_maf_tool.hits import HitStore
+
+
+def synthetic_sample(aliquot_submitter_id):
+    aliquots = [{"submitter_id": aliquot_submitter_id}]
+    return {
+        "sample_type": "Primary Tumor",
+        "tissue_type": "Not Reported",
+        "portions": [{"analytes": [{"aliquots": aliquots}]}],
+    }
+
+
+def synthetic_hits(count, samples_per_case):
+    return [
+        {
+            "file_id": str(uuid.uuid4()),
+            "md5sum": uuid.uuid4().hex,
+            "file_size": 4771,
+            "created_datetime": "2020-03-17T21:24:16.127588-05:00",
+            "cases": [
+                {
+                    "case_id": str(uuid.uuid4()),
+                    "project": {"project_id": "TARGET-AML"},
+                    "samples": [
+                        synthetic_sample("ALIQUOT-{}-{}".format(i, j))
+                        for j in range(samples_per_case)
+                    ],
+                }
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_parse_hit(hit):
+    return {
+        "file_id": hit["file_id"],
+        "md5sum": hit["md5sum"],
+        "file_size": hit["file_size"],
+        "created_datetime": hit["created_datetime"],
+        "case_id": hit["cases"][0]["case_id"],
+        "project_id": hit["cases"][0]["project"]["project_id"],
+        "samples": {
+            sample["portions"][0]["analytes"][0]["aliquots"][0]["submitter_id"]: {
+                "sample_type": sample["sample_type"],
+                "tissue_type": sample["tissue_type"],
+                "aliquot_submitter_id": sample["portions"][0]["analytes"][0][
+                    "aliquots"
+                ][0]["submitter_id"],
+            }
+            for sample in hit["cases"][0]["samples"]
+        },
+    }
+
+
+def legacy(raw_hits, expected_file_ids, expected_case_ids):
+    hit_map = {h["file_id"]: h for h in (legacy_parse_hit(h) for h in raw_hits)}
+    for expected, key in (
+        (expected_file_ids, "file_id"),
+        (expected_case_ids, "case_id"),
+    ):
+        found = {h[key] for h in hit_map.values()}
+        set(expected) - found
+    return hit_map
+
+
+def compact(raw_hits, expected_file_ids, expected_case_ids):
+    store = HitStore()
+    for hit in raw_hits:
+        store.add_api_hit(hit)
+    for expected, key in (
+        (expected_file_ids, "file_id"),
+        (expected_case_ids, "case_id"),
+    ):
+        set(expected) - store.ids(key)
+    return store
+
+
+def measure(name, func, *args):
+    gc.collect()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(*args)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+
+    print("{:<8} {:>8.2f} s {:>10.1f} MiB".format(name, elapsed, retained / 2 ** 20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hits", type=int, default=100000)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    raw_hits = synthetic_hits(args.hits, args.samples)
+    file_ids = [h["file_id"] for h in raw_hits] + [str(uuid.uuid4())]
+    case_ids = [h["cases"][0]["case_id"] for h in raw_hits] + [str(uuid.uuid4())]
+
+    print("{} hits, {} samples per case".format(args.hits, args.samples))
+    print("{:<8} {:>10} {:>14}".format("", "time", "retained"))
+    measure("dicts", legacy, raw_hits, file_ids, case_ids)
+    measure("store", compact, raw_hits, file_ids, case_ids)
+
+
+if __name__ == "__main__":
+    main()
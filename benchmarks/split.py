@@ -0,0 +1,118 @@
+"""Compare writing an aggregated MAF as one file with --split-by on synthetic rows.
+
+Usage: PYTHONPATH=. python benchmarks/split.py [--rows 50000] [--workers 4]
+
+aggregate_mafs gzips its output on the calling thread, which is stood in for
+here by a GzipFile at its default compression level. With --split-by that
+output is decompressed again by GunzipWriter and recompressed per partition
+by the workers. Reports wall time, CPU time of the calling thread, which is
+the serial part of the run, and CPU time over all threads. Linux only.
+"""
+import argparse
+import gzip
+import os
+import random
+import resource
+import tempfile
+import time
+
+from gdc_maf_tool import partition
+
+COLUMNS = 120
+CHROMOSOMES = ["chr{}".format(c) for c in list(range(1, 23)) + ["X", "Y"]]
+
+
+def synthetic_maf(rows, aliquots=50):
+    rng = random.Random(0)  # nosec
+    header = (
+        b"#version gdc-1.0.0\n"
+        + b"#tumor.aliquots.submitter_id "
+        + ",".join("ALIQUOT-{}".format(a) for a in range(aliquots)).encode()
+        + b"\n"
+        + "\t".join(
+            ["Hugo_Symbol", "Chromosome"]
+            + ["column_{}".format(c) for c in range(COLUMNS - 2)]
+        ).encode()
+        + b"\n"
+    )
+    lines = []
+    per_aliquot = rows // aliquots
+    for aliquot in range(aliquots):
+        # Rows of each aliquot are ordered by chromosome.
+        for i in range(per_aliquot):
+            chromosome = CHROMOSOMES[i * len(CHROMOSOMES) // per_aliquot]
+            values = [
+                "GENE{}".format(rng.randrange(20000)),
+                chromosome,
+                str(rng.randrange(1, 250000000)),
+                "ALIQUOT-{}".format(aliquot),
+            ] + [
+                rng.choice(["", ".", "PASS", "SNP", str(rng.random())])
+                for _ in range(COLUMNS - 4)
+            ]
+            lines.append("\t".join(values).encode() + b"\n")
+    return header, lines
+
+
+def aggregate(header, lines, output):
+    with gzip.GzipFile(fileobj=output, mode="wb") as gz:
+        gz.write(header)
+        for line in lines:
+            gz.write(line)
+
+
+def thread_time():
+    # time.thread_time needs Python 3.7.
+    usage = resource.getrusage(resource.RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+
+def timed(run):
+    wall, main, cpu = time.perf_counter(), thread_time(), time.process_time()
+    run()
+    return (
+        time.perf_counter() - wall,
+        thread_time() - main,
+        time.process_time() - cpu,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    header, lines = synthetic_maf(args.rows)
+    size = len(header) + sum(len(line) for line in lines)
+    print(
+        "{} rows, {:.1f} MiB uncompressed, {} workers".format(
+            len(lines), size / (1 << 20), args.workers
+        )
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        def plain():
+            with open(os.path.join(directory, "out.maf.gz"), "wb") as f:
+                aggregate(header, lines, f)
+
+        def split(by):
+            partitioner = partition.MafPartitioner(
+                os.path.join(directory, by), by, 50000, args.workers
+            )
+            with partition.GunzipWriter(partitioner) as f:
+                aggregate(header, lines, f)
+            partitioner.close()
+
+        print("{:<24} {:>8} {:>12} {:>8}".format("", "wall", "main thread", "cpu"))
+        for name, run in [
+            ("one file", plain),
+            ("--split-by chromosome", lambda: split("chromosome")),
+            ("--split-by rows", lambda: split("rows")),
+        ]:
+            print("{:<24} {:>6.2f} s {:>10.2f} s {:>6.2f} s".format(name, *timed(run)))
+
+
+if __name__ == "__main__":
+    main()
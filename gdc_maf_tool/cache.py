@@ -0,0 +1,132 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from gdc_maf_tool.log import logger
+
+DEFAULT_TTL = 24 * 60 * 60
+
+# Bump whenever the layout of the cached hits changes, so that older entries
+# are refetched rather than misread.
+FORMAT_VERSION = 2
+
+ENTRY_KEYS = {"version", "created", "release", "hits"}
+
+
+def _normalize(value: Any) -> Any:
+    """Order filter values so that equivalent queries serialize identically."""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [_normalize(v) for v in value]
+        return sorted(items, key=lambda v: json.dumps(v, sort_keys=True))
+    return value
+
+
+def cache_key(filters: Dict, fields: List[str]) -> str:
+    """Hash a /files query into a cache key.
+
+    The order of filter clauses, filter values and fields does not matter.
+    """
+    normalized = json.dumps(
+        {"filters": _normalize(filters), "fields": sorted(fields)}, sort_keys=True
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class MetadataCache:
+    """File-backed cache of parsed /files hits.
+
+    Each query is stored as one JSON file named after its cache key. Entries
+    expire after `ttl` seconds, or as soon as the GDC data release they were
+    fetched under is no longer the current one.
+
+    Attributes:
+        directory: Where cache entries are stored.
+        ttl: Maximum age of an entry in seconds.
+    """
+
+    def __init__(self, directory: str, ttl: int = DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, "{}.json".format(key))
+
+    def get(self, key: str, release: Optional[str]) -> Any:
+        """Return the cached hits for `key`, or None if missing or stale.
+
+        If `release` is None the current data release is unknown, and only the
+        TTL is checked.
+        """
+        try:
+            with open(self._path(key)) as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable metadata cache entry %s: %s", key, e)
+            return None
+
+        if not isinstance(entry, dict):
+            logger.warning("Ignoring malformed metadata cache entry %s", key)
+            return None
+
+        if entry.get("version") != FORMAT_VERSION:
+            logger.info("Metadata cache entry %s has an old format", key)
+            return None
+
+        if not ENTRY_KEYS <= entry.keys() or not isinstance(
+            entry["created"], (int, float)
+        ):
+            logger.warning("Ignoring malformed metadata cache entry %s", key)
+            return None
+
+        if time.time() - entry["created"] > self.ttl:
+            logger.info("Metadata cache entry %s expired", key)
+            return None
+
+        if release and entry["release"] != release:
+            logger.info(
+                "Metadata cache entry %s is from %s, not %s",
+                key,
+                entry["release"],
+                release,
+            )
+            return None
+
+        return entry["hits"]
+
+    def put(self, key: str, hits: Any, release: Optional[str]) -> None:
+        """Store `hits` under `key`. Failing to write the entry is only logged."""
+        entry = {
+            "version": FORMAT_VERSION,
+            "created": time.time(),
+            "release": release,
+            "hits": hits,
+        }
+
+        # Write to a temporary file first so that concurrent runs never read a
+        # partially written entry.
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        except OSError as e:
+            logger.warning("Unable to write metadata cache entry %s: %s", key, e)
+            return
+
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException as e:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            if not isinstance(e, OSError):
+                raise
+            logger.warning("Unable to write metadata cache entry %s: %s", key, e)
@@ -1,14 +1,28 @@
 import argparse
-from typing import List
+import functools
+import ipaddress
+import os
+import sys
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
 
 from aliquot_level_maf.aggregation import aggregate_mafs
-from defusedcsv import csv
 
-from gdc_maf_tool import __version__, gdc_api_client, log
+from gdc_maf_tool import (
+    __version__,
+    cache,
+    gdc_api_client,
+    log,
+    maf,
+    manifest,
+    partition,
+    profiling,
+    serve,
+)
 from gdc_maf_tool.log import logger
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(
         description="----GDC MAF Concatenation Tool v{}----".format(__version__),
     )
@@ -43,43 +57,214 @@ def parse_args() -> argparse.Namespace:
         default="outfile.maf.gz",
         help="Output file name for the resulting aggregate MAF (default: outfile.maf.gz).",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--shard",
+        default=None,
+        type=parse_shard,
+        help="Only aggregate shard I of N, e.g. 2/4. Cases are split between "
+        "shards deterministically; combine the shard outputs with "
+        "'gdc-maf-tool merge'.",
+    )
+    parser.add_argument(
+        "--split-by",
+        choices=partition.SPLIT_MODES,
+        default=None,
+        help="Write the aggregate MAF as several gzipped MAFs, one per chromosome "
+        "or per --max-rows rows, plus a manifest listing them. Partitions are "
+        "named after the output file name.",
+    )
+    parser.add_argument(
+        "--max-rows",
+        type=positive_int,
+        default=1000000,
+        help="Most rows per partition with --split-by rows (default: 1000000).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=positive_int,
+        default=os.cpu_count() or 1,
+        help="Number of workers compressing partitions (default: number of CPUs).",
+    )
+    add_cache_args(parser)
+    parser.add_argument(
+        "--profile",
+        action="append",
+        choices=profiling.MODES,
+        help="Profile each stage of the run with cProfile (cpu) and/or "
+        "tracemalloc (memory). May be given twice.",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default="profile",
+        help="Directory for the per-stage profile dumps and summary.txt "
+        "(default: profile).",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=positive_int,
+        default=25,
+        help="Number of entries in each top-N listing of the summary (default: 25).",
+    )
+    return parser.parse_args(argv)
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("{} is not a positive number".format(value))
+    return number
+
+
+def parse_shard(value: str) -> gdc_api_client.Shard:
+    try:
+        index, count = (int(v) for v in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Shard must look like I/N, e.g. 2/4")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("Shard I/N must have 1 <= I <= N")
+    return gdc_api_client.Shard(index, count)
+
+
+def loopback_host(value: str) -> str:
+    # Jobs read and write any path they name, so only local users may submit them.
+    if value == "localhost":
+        return value
+    try:
+        loopback = ipaddress.ip_address(value).is_loopback
+    except ValueError:
+        loopback = False
+    if not loopback:
+        raise argparse.ArgumentTypeError(
+            "{} is not a loopback address, e.g. 127.0.0.1 or ::1".format(value)
+        )
+    return value
+
+
+def split_from_args(args: argparse.Namespace) -> Optional[partition.SplitOptions]:
+    if not args.split_by:
+        return None
+    return partition.SplitOptions(args.split_by, args.max_rows, args.workers)
+
+
+def add_cache_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Directory in which to cache file metadata between runs (default: no cache).",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=cache.DEFAULT_TTL,
+        help="Seconds before cached metadata is refetched, even if the GDC data "
+        "release has not changed (default: {}).".format(cache.DEFAULT_TTL),
+    )
+
+
+def cache_from_args(args: argparse.Namespace) -> Optional[cache.MetadataCache]:
+    if not args.cache_dir:
+        return None
+    return cache.MetadataCache(args.cache_dir, args.cache_ttl)
+
+
+def parse_serve_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="gdc-maf-tool serve",
+        description="Run a long-lived process that accepts aggregation jobs over "
+        "a localhost HTTP API.",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        type=loopback_host,
+        help="Loopback address to listen on (default: 127.0.0.1). The API has "
+        "no authentication, so it can't listen on other addresses.",
+    )
+    parser.add_argument(
+        "--port", type=int, default=8787, help="Port to listen on (default: 8787)."
+    )
+    add_cache_args(parser)
+    return parser.parse_args(argv)
+
+
+def parse_merge_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="gdc-maf-tool merge",
+        description="Merge aggregated MAFs, such as the outputs of --shard, into "
+        "one aggregated MAF.",
+    )
+    parser.add_argument("inputs", nargs="+", help="Aggregated MAFs to merge, in order.")
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output_filename",
+        default="outfile.maf.gz",
+        help="Output file name for the merged MAF (default: outfile.maf.gz).",
+    )
+    return parser.parse_args(argv)
+
+
+def merge(inputs: List[str], output_filename: str) -> None:
+    logger.info("Merging %d MAFs into %s", len(inputs), output_filename)
+    try:
+        maf.merge_mafs(inputs, output_filename)
+    except (OSError, EOFError, zlib.error, ValueError) as e:
+        log.fatal("Unable to merge MAFs: {}".format(e))
 
 
 def ids_from_manifest(manifest_name: str) -> List[str]:
     """
     Reads in a GDC Manifest to parse out UUIDs
     """
+    return [entry.id for entry in manifest.read_manifest(manifest_name)]
 
-    id_list = []
-    with open(manifest_name) as f:
-        id_list = [r["id"] for r in csv.DictReader(f, delimiter="\t") if r.get("id")]
-        if not id_list:
-            log.fatal(
-                "Input must be valid GDC Manifest. For a valid manifest "
-                "visit https://portal.gdc.cancer.gov/"
-            )
-
-    return id_list
 
+def aggregate(
+    project_id: Optional[str],
+    case_ids: List[str],
+    file_ids: List[str],
+    token: Optional[str],
+    output_filename: str,
+    metadata_cache: Optional[cache.MetadataCache] = None,
+    shard: Optional[gdc_api_client.Shard] = None,
+    split: Optional[partition.SplitOptions] = None,
+    file_manifest: Sequence[manifest.ManifestEntry] = (),
+    failed_downloads_filename: str = gdc_api_client.FAILED_DOWNLOAD_FILENAME,
+) -> List[Dict[str, str]]:
+    """Aggregate the selected MAFs and return the downloads that failed.
 
-def main() -> None:
-    args = parse_args()
-    token = None
-    if args.token:
-        token = args.token.read()
-
-    case_ids = []
-    file_ids = []
-    if args.case_manifest:
-        case_ids = ids_from_manifest(args.case_manifest)
-    elif args.file_manifest:
-        file_ids = ids_from_manifest(args.file_manifest)
-
-    mafs = gdc_api_client.collect_mafs(args.project_id, case_ids, file_ids, token)
+    Failed downloads are also written to failed_downloads_filename. If every
+    download failed the program exits.
+    """
+    mafs = gdc_api_client.collect_mafs(
+        project_id,
+        case_ids,
+        file_ids,
+        token,
+        metadata_cache,
+        shard,
+        file_manifest,
+        failed_downloads_filename,
+    )
 
-    with open(args.output_filename, "wb") as f:
-        aggregate_mafs(mafs, f)
+    if split:
+        partitioner = partition.MafPartitioner(
+            partition.output_prefix(output_filename), *split
+        )
+        with profiling.stage("aggregate_mafs"):
+            try:
+                with partition.GunzipWriter(partitioner) as f:
+                    aggregate_mafs(mafs, f)
+                partitioner.close()
+            except BaseException as e:
+                # Don't leave partial partitions, or the executor, behind.
+                partitioner.abort()
+                if isinstance(e, partition.PartitionError):
+                    log.fatal("Unable to split the aggregate MAF: {}".format(e))
+                raise
+    else:
+        with open(output_filename, "wb") as f, profiling.stage("aggregate_mafs"):
+            aggregate_mafs(mafs, f)
 
     failed_downloads = [
         {
@@ -94,10 +279,92 @@ def main() -> None:
         logger.warning(
             "There are %d failed downloads. Please check %s for details",
             len(failed_downloads),
-            gdc_api_client.FAILED_DOWNLOAD_FILENAME,
+            failed_downloads_filename,
         )
-        gdc_api_client.write_failed_download_manifest(failed_list=failed_downloads)
+        gdc_api_client.write_failed_download_manifest(
+            failed_downloads, failed_downloads_filename
+        )
+        if len(failed_downloads) == len(mafs):
+            log.fatal(
+                "All {} downloads failed, see {}".format(
+                    len(mafs), failed_downloads_filename
+                ),
+                failed_downloads,
+            )
     logger.info("Successfully downloaded %s files", len(mafs) - len(failed_downloads))
+    return failed_downloads
+
+
+def run_job(
+    params: Dict[str, Any], metadata_cache: Optional[cache.MetadataCache] = None
+) -> List[Dict[str, str]]:
+    """Run one aggregation job submitted to the serve mode API."""
+    case_ids = params["case_ids"]
+    file_ids = params["file_ids"]
+    file_manifest = []  # type: List[manifest.ManifestEntry]
+    if params["case_manifest"]:
+        case_ids = ids_from_manifest(params["case_manifest"])
+    elif params["file_manifest"]:
+        file_manifest = manifest.read_manifest(params["file_manifest"])
+        file_ids = [entry.id for entry in file_manifest]
+
+    return aggregate(
+        params["project_id"],
+        case_ids,
+        file_ids,
+        params["token"],
+        params["output_filename"],
+        metadata_cache,
+        file_manifest=file_manifest,
+        failed_downloads_filename=params["failed_downloads_filename"],
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv[:1] == ["serve"]:
+        serve_args = parse_serve_args(argv[1:])
+        runner = functools.partial(run_job, metadata_cache=cache_from_args(serve_args))
+        serve.serve(runner, serve_args.host, serve_args.port)
+        return
+
+    if argv[:1] == ["merge"]:
+        merge_args = parse_merge_args(argv[1:])
+        merge(merge_args.inputs, merge_args.output_filename)
+        return
+
+    args = parse_args(argv)
+    token = None
+    if args.token:
+        token = args.token.read()
+
+    case_ids = []
+    file_ids = []
+    file_manifest = []  # type: List[manifest.ManifestEntry]
+    if args.case_manifest:
+        case_ids = ids_from_manifest(args.case_manifest)
+    elif args.file_manifest:
+        file_manifest = manifest.read_manifest(args.file_manifest)
+        file_ids = [entry.id for entry in file_manifest]
+
+    if args.profile:
+        profiling.enable(args.profile, args.profile_dir, args.profile_top)
+    try:
+        aggregate(
+            args.project_id,
+            case_ids,
+            file_ids,
+            token,
+            args.output_filename,
+            cache_from_args(args),
+            args.shard,
+            split_from_args(args),
+            file_manifest,
+        )
+    finally:
+        profiling.finish()
 
 
 if __name__ == "__main__":
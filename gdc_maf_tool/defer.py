@@ -4,6 +4,7 @@ from typing import Callable, Optional
 
 import requests
 
+from gdc_maf_tool import profiling
 from gdc_maf_tool.log import logger
 
 ResponseProvider = Callable[[], requests.Response]
@@ -39,7 +40,8 @@ class DeferredRequestReader(io.BufferedIOBase):
         if self._response:
             return
 
-        response = self._provider()
+        with profiling.stage("download"):
+            response = self._provider()
         if response.status_code == 403:
             logger.warn("[403] Unable to downoad %s. Skipping...", self.uuid)
             self.failed_reason = "Not authorized"
@@ -57,7 +59,8 @@ class DeferredRequestReader(io.BufferedIOBase):
             self.failed_reason = "Uncaught error code: {}".format(response.status_code)
             return
 
-        self._validate_checksum(response)
+        with profiling.stage("md5"):
+            self._validate_checksum(response)
 
         self._content_position = 0
         self._content_length = len(response.content)
@@ -1,7 +1,8 @@
 import datetime
 import json
 import os
-from typing import Any, Dict, List, Optional
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set
 
 import requests
 from aliquot_level_maf.aggregation import AliquotLevelMaf
@@ -12,18 +13,47 @@ from aliquot_level_maf.selection import (
 )
 from defusedcsv import csv
 
-from gdc_maf_tool import defer, log
+from gdc_maf_tool import cache as metadata_cache
+from gdc_maf_tool import defer, log, profiling
+from gdc_maf_tool.hits import HitStore
 from gdc_maf_tool.log import logger
+from gdc_maf_tool.manifest import ManifestEntry
 
 date = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 FAILED_DOWNLOAD_FILENAME = "failed-downloads-{}.tsv".format(date)
 
+# One session per process so that the connection pool (and its TLS connections)
+# is reused across metadata queries, downloads and, in serve mode, across jobs.
+session = requests.Session()
+
+
+class Shard(NamedTuple):
+    """One of `count` deterministic partitions of the selected MAFs, by case.
+
+    `index` starts at 1.
+    """
+
+    index: int
+    count: int
+
+    def __contains__(self, case_id: str) -> bool:
+        # crc32 rather than hash() because str hashes are salted per process,
+        # and every node has to agree on where each case goes.
+        return zlib.crc32(case_id.encode()) % self.count == self.index - 1
+
 
 def query_hits(
-    project_id: str, file_uuids: List[str], case_uuids: List[str], page_size: int = 5000
-) -> List[Dict[str, Any]]:
+    project_id: str,
+    file_uuids: List[str],
+    case_uuids: List[str],
+    page_size: int = 5000,
+    cache: Optional[metadata_cache.MetadataCache] = None,
+) -> HitStore:
     """
     Retrieves IDs when provided a project_id or list of UUIDs
+
+    If a cache is given, parsed hits from an earlier identical query are reused
+    as long as they are fresh and from the current data release.
     """
 
     # All queries start out as filtering on a MAF file that's a Masked Somatic Mutation.
@@ -84,6 +114,19 @@ def query_hits(
         "cases.samples.portions.analytes.aliquots.submitter_id",
     ]
 
+    if cache:
+        key = metadata_cache.cache_key(filters, fields)
+        release = get_data_release()
+        columns = cache.get(key, release)
+        if columns is not None:
+            try:
+                hits = HitStore.from_columns(columns)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                logger.warning("Ignoring malformed cached metadata: %s", e)
+            else:
+                logger.info("Using cached metadata")
+                return hits
+
     query = {
         "fields": ",".join(fields),
         "filters": json.dumps(filters),
@@ -91,47 +134,47 @@ def query_hits(
         "size": str(page_size),
     }
     logger.info("Gathering metadata...")
+    hits = HitStore()
     data = _files_query(query)
-    hits = [_parse_hit(hit) for hit in data["hits"]]
+    _add_hits(hits, data["hits"])
 
     while data["pagination"]["page"] < data["pagination"]["pages"]:
         # Prep the query to get the next page.
         query["from"] = str(int(query["from"]) + page_size)
         data = _files_query(query)
-        hits += [_parse_hit(hit) for hit in data["hits"]]
+        _add_hits(hits, data["hits"])
 
     logger.info("Done gathering metadata")
+    if cache:
+        cache.put(key, hits.to_columns(), release)
     return hits
 
 
+def get_data_release() -> Optional[str]:
+    """Return the current GDC data release, or None if it can't be determined."""
+    try:
+        resp = session.get("https://api.gdc.cancer.gov/status")
+        resp.raise_for_status()
+        return resp.json()["data_release"]
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logger.warning("Unable to determine the GDC data release: %s", e)
+        return None
+
+
+def _add_hits(hit_store: HitStore, hits: List[Dict]) -> None:
+    with profiling.stage("parse_hits"):
+        for hit in hits:
+            hit_store.add_api_hit(hit)
+
+
 def _files_query(query: Dict) -> Dict:
-    resp = requests.post("https://api.gdc.cancer.gov/files", json=query)
+    with profiling.stage("files_query"):
+        resp = session.post("https://api.gdc.cancer.gov/files", json=query)
     if resp.status_code != 200:
         log.fatal("Unable to perform request {}".format(resp.json()))
     return resp.json()["data"]
 
 
-def _parse_hit(hit: Dict) -> Dict:
-    return {
-        "file_id": hit["file_id"],
-        "md5sum": hit["md5sum"],
-        "file_size": hit["file_size"],
-        "created_datetime": hit["created_datetime"],
-        "case_id": hit["cases"][0]["case_id"],
-        "project_id": hit["cases"][0]["project"]["project_id"],
-        "samples": {
-            sample["portions"][0]["analytes"][0]["aliquots"][0]["submitter_id"]: {
-                "sample_type": sample["sample_type"],
-                "tissue_type": sample["tissue_type"],
-                "aliquot_submitter_id": sample["portions"][0]["analytes"][0][
-                    "aliquots"
-                ][0]["submitter_id"],
-            }
-            for sample in hit["cases"][0]["samples"]
-        },
-    }
-
-
 def download_maf(
     case_id: str, uuid: str, md5sum: str, token: str = None
 ) -> defer.DeferredRequestReader:
@@ -147,14 +190,14 @@ def download_maf(
             headers = {"X-Auth-Token": token}
 
         logger.info("Downloading File: %s ", uuid)
-        return requests.get(f"https://api.gdc.cancer.gov/data/{uuid}", headers=headers,)
+        return session.get(f"https://api.gdc.cancer.gov/data/{uuid}", headers=headers,)
 
     return defer.DeferredRequestReader(provider, case_id, uuid, md5sum)
 
 
-def only_one_project_id(hit_map: Dict) -> None:
+def only_one_project_id(hit_store: HitStore) -> None:
     """ Confirm that there's only one project_id in the list of hits."""
-    project_ids = {h["project_id"] for h in hit_map.values()}
+    project_ids = hit_store.project_ids()
     if len(project_ids) > 1:
         log.fatal(
             "Can only have one project id. Project ids included: {}".format(
@@ -163,29 +206,32 @@ def only_one_project_id(hit_map: Dict) -> None:
         )
 
 
-def collect_criteria(hit_map: Dict) -> List[PrimaryAliquotSelectionCriterion]:
-    criteria = []
-    for hit in hit_map.values():
-        sample_criteria = [
-            SampleCriterion(
-                id=sample["aliquot_submitter_id"], sample_type=sample["sample_type"]
-            )
-            for sample in hit["samples"].values()
-        ]
-
-        criteria.append(
-            PrimaryAliquotSelectionCriterion(
-                id=hit["file_id"],
-                samples=sample_criteria,
-                case_id=hit["case_id"],
-                maf_creation_date=hit["created_datetime"],
-            )
+def collect_criteria(hit_store: HitStore) -> List[PrimaryAliquotSelectionCriterion]:
+    return [
+        PrimaryAliquotSelectionCriterion(
+            id=hit.file_id,
+            samples=[
+                SampleCriterion(
+                    id=sample.aliquot_submitter_id, sample_type=sample.sample_type
+                )
+                for sample in hit.samples
+            ],
+            case_id=hit.case_id,
+            maf_creation_date=hit.created_datetime,
         )
-    return criteria
+        for hit in hit_store
+    ]
 
 
 def collect_mafs(
-    project_id: str, case_ids: List[str], file_ids: List[str], token: Optional[str]
+    project_id: str,
+    case_ids: List[str],
+    file_ids: List[str],
+    token: Optional[str],
+    cache: Optional[metadata_cache.MetadataCache] = None,
+    shard: Optional[Shard] = None,
+    file_manifest: Sequence[ManifestEntry] = (),
+    failed_downloads_filename: str = FAILED_DOWNLOAD_FILENAME,
 ) -> List[AliquotLevelMaf]:
     """Put together a list of mafs given one of: project_id, case_ids, file_ids.
 
@@ -194,43 +240,107 @@ def collect_mafs(
     - If file_ids then gather all the mafs of those file_ids.
     - If a project_id is provided then gather all the aliquot level mafs for that
     project.
+    - If a shard is provided then only keep the mafs of the cases in that shard.
+    - If a file manifest is provided then skip the mafs whose md5 or size
+    disagree with it.
+
+    Ids that can't be found and files that are skipped are written to
+    failed_downloads_filename.
     """
 
-    hit_map = _build_hit_map(query_hits(project_id, file_ids, case_ids))
-    if project_id and len(hit_map) == 0:
+    hit_store = query_hits(project_id, file_ids, case_ids, cache=cache)
+    if project_id and len(hit_store) == 0:
         log.fatal("No MAF files found for {}.".format(project_id))
 
     # At this point we only have a case_id or file_id, and no extra information
     # from the /files endpoint. That means for every missing id we can only fill
     # out one of the two id columns in the fail tsv report.
     if case_ids:
-        check_for_missing_ids(hit_map, case_ids, "case_id")
+        check_for_missing_ids(hit_store, case_ids, "case_id", failed_downloads_filename)
 
     if file_ids:
-        check_for_missing_ids(hit_map, file_ids, "file_id")
+        check_for_missing_ids(hit_store, file_ids, "file_id", failed_downloads_filename)
+
+    mismatched = check_manifest_checksums(
+        hit_store, file_manifest, failed_downloads_filename
+    )
+
+    with profiling.stage("select_primary_aliquots"):
+        return _select_mafs(hit_store, token, shard, mismatched)
+
+
+def check_manifest_checksums(
+    hit_store: HitStore,
+    file_manifest: Sequence[ManifestEntry],
+    failed_downloads_filename: str = FAILED_DOWNLOAD_FILENAME,
+) -> Set[str]:
+    """Compare the md5 and size in a file manifest with the /files metadata.
+
+    Files that disagree would fail their checksum once downloaded, so they are
+    reported up front, written to the failed downloads TSV and their file_ids
+    returned so they are not downloaded.
+    """
+    failed = []
+    for entry in file_manifest:
+        if entry.id not in hit_store:
+            continue
+
+        hit = hit_store[entry.id]
+        reasons = []
+        if entry.md5 and entry.md5 != hit.md5sum:
+            reasons.append(
+                "md5 {} in manifest but {} in GDC metadata".format(
+                    entry.md5, hit.md5sum
+                )
+            )
+        if entry.size is not None and entry.size != hit.file_size:
+            reasons.append(
+                "size {} in manifest but {} in GDC metadata".format(
+                    entry.size, hit.file_size
+                )
+            )
+        if reasons:
+            failed.append(
+                {
+                    "case_id": hit.case_id,
+                    "file_id": hit.file_id,
+                    "reason": "; ".join(reasons),
+                }
+            )
 
-    return _select_mafs(hit_map, token)
+    if failed:
+        logger.warning(
+            "Skipping %d files whose manifest md5 or size disagrees with the GDC "
+            "metadata: %s",
+            len(failed),
+            ", ".join(f["file_id"] for f in failed),
+        )
+        write_failed_download_manifest(failed, failed_downloads_filename)
+    return {f["file_id"] for f in failed}
 
 
 def check_for_missing_ids(
-    hit_map: Dict[str, Dict], expected_uuids: List[str], hit_key: str,
+    hit_store: HitStore,
+    expected_uuids: List[str],
+    hit_key: str,
+    failed_downloads_filename: str = FAILED_DOWNLOAD_FILENAME,
 ):
-    """For a list of ids check to see if they exist in the hit_map generated from the /files endpoint
+    """For a list of ids check to see if they exist in the hit_store generated from the /files endpoint
 
     If there's a difference between what was requested and what was received then
     warn the user and write the failed uuids to a TSV. The TSV file should consist
     of the uuid (case_id or file_id) in it's respective column and the reason
     why it failed to download.
     """
-    found_uuids = {h[hit_key] for h in hit_map.values()}
+    failed_uuids = set(expected_uuids) - hit_store.ids(hit_key)
 
-    if set(expected_uuids) != found_uuids:
-        failed_uuids = set(expected_uuids) - found_uuids
+    if failed_uuids:
         write_failed_download_manifest(
             failed_list=[
                 {hit_key: uuid, "reason": "{} not found".format(hit_key)}
                 for uuid in failed_uuids
             ],
+            filename=failed_downloads_filename,
         )
         logger.warning(
             "Unable to find information for these {}s: {}".format(
@@ -239,38 +349,46 @@ def check_for_missing_ids(
         )
 
 
-def _build_hit_map(hits):
-    return {h["file_id"]: h for h in hits}
-
-
-def _select_mafs(hit_map, token):
+def _select_mafs(hit_store, token, shard=None, exclude=frozenset()):
     mafs = []
-    only_one_project_id(hit_map)
+    only_one_project_id(hit_store)
 
-    criteria = collect_criteria(hit_map)
+    # Select from every hit, and only then drop the excluded files, so that a
+    # case whose primary aliquot is excluded fails rather than silently
+    # falling back to another of its aliquots.
+    criteria = collect_criteria(hit_store)
     selections = select_primary_aliquots(criteria)
 
     for primary_aliquot in selections.values():
-        hit = hit_map[primary_aliquot.id]
-        sample_id = hit["samples"][primary_aliquot.sample_id]["aliquot_submitter_id"]
+        hit = hit_store[primary_aliquot.id]
+        if shard and hit.case_id not in shard:
+            continue
+        if hit.file_id in exclude:
+            continue
 
         deferred_maf = download_maf(
-            hit["case_id"], primary_aliquot.id, md5sum=hit["md5sum"], token=token,
+            hit.case_id, primary_aliquot.id, md5sum=hit.md5sum, token=token,
         )
+        # The sample ids given to select_primary_aliquots are the aliquot
+        # submitter ids.
         mafs.append(
-            AliquotLevelMaf(file=deferred_maf, tumor_aliquot_submitter_id=sample_id,)
+            AliquotLevelMaf(
+                file=deferred_maf, tumor_aliquot_submitter_id=primary_aliquot.sample_id,
+            )
         )
 
     return mafs
 
 
-def write_failed_download_manifest(failed_list: List[Dict[str, str]]) -> None:
-    logger.warning("Writing failed download ids to file: %s", FAILED_DOWNLOAD_FILENAME)
+def write_failed_download_manifest(
+    failed_list: List[Dict[str, str]], filename: str = FAILED_DOWNLOAD_FILENAME
+) -> None:
+    logger.warning("Writing failed download ids to file: %s", filename)
 
     fieldnames = ["case_id", "file_id", "reason"]
-    with open(FAILED_DOWNLOAD_FILENAME, "a") as f:
+    with open(filename, "a") as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t")
         # Only write the headers if there's nothing in the file yet.
-        if os.stat(FAILED_DOWNLOAD_FILENAME).st_size == 0:
+        if os.stat(filename).st_size == 0:
             writer.writeheader()
         writer.writerows(failed_list)
@@ -0,0 +1,352 @@
+from array import array
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    KeysView,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+)
+
+
+class Sample(NamedTuple):
+    """The parts of a /files sample needed to select a primary aliquot."""
+
+    aliquot_submitter_id: str
+    sample_type: str
+    tissue_type: str
+
+
+class Hit(NamedTuple):
+    """One aliquot level MAF as returned by the /files endpoint.
+
+    Attributes:
+        samples: The samples of the MAF's case, one per aliquot submitter id.
+    """
+
+    file_id: str
+    md5sum: str
+    file_size: int
+    created_datetime: str
+    case_id: str
+    project_id: str
+    samples: List[Sample]
+
+
+class HitStore:
+    """Column oriented store of /files hits, indexed by file_id, case_id and aliquot.
+
+    Each hit is a row number into parallel lists and arrays, and the indexes
+    map ids to row numbers. Hits with the same case_id, or samples with the
+    same aliquot submitter id, are chained through arrays of row numbers
+    instead of per-id lists. Each of those two indexes is built in one pass the
+    first time it's needed, rather than on every add.
+
+    Like the dict of hits keyed by file_id it replaces, a repeated file_id
+    keeps the position of its first hit and the content of its last.
+
+    Compared to a dict per hit this keeps the store small and, since it holds
+    only a handful of containers, keeps the garbage collector from repeatedly
+    scanning tens of thousands of objects.
+
+    Hit objects are only built when a row is read.
+    """
+
+    __slots__ = (
+        "_file_ids",
+        "_md5sums",
+        "_file_sizes",
+        "_created_datetimes",
+        "_case_ids",
+        "_project_ids",
+        # Samples of row i are _aliquots[_sample_starts[i]:_sample_starts[i + 1]]
+        "_sample_starts",
+        "_sample_rows",
+        "_aliquots",
+        "_sample_types",
+        "_tissue_types",
+        "_by_file_id",
+        "_by_case_id",
+        "_next_in_case",
+        "_by_aliquot",
+        "_next_with_aliquot",
+    )
+
+    def __init__(self, hits: Iterable[Hit] = ()):
+        self._file_ids = []  # type: List[str]
+        self._md5sums = []  # type: List[str]
+        self._file_sizes = array("q")
+        self._created_datetimes = []  # type: List[str]
+        self._case_ids = []  # type: List[str]
+        self._project_ids = []  # type: List[str]
+        self._sample_starts = array("q", [0])
+        self._sample_rows = array("q")
+        self._aliquots = []  # type: List[str]
+        self._sample_types = []  # type: List[str]
+        self._tissue_types = []  # type: List[str]
+        self._by_file_id = {}  # type: Dict[str, int]
+        # Built on first use, see _index_cases and _index_aliquots.
+        self._by_case_id = None  # type: Optional[Dict[str, int]]
+        self._next_in_case = array("q")
+        self._by_aliquot = None  # type: Optional[Dict[str, int]]
+        self._next_with_aliquot = array("q")
+        for hit in hits:
+            self.add(*hit)
+
+    def add(
+        self,
+        file_id: str,
+        md5sum: str,
+        file_size: int,
+        created_datetime: str,
+        case_id: str,
+        project_id: str,
+        samples: Iterable[Sample],
+    ) -> None:
+        """Add a hit, replacing any with the same file_id but keeping its position."""
+        row = self._set_row(
+            file_id, md5sum, file_size, created_datetime, case_id, project_id
+        )
+        aliquots = []  # type: List[str]
+        sample_types = []  # type: List[str]
+        tissue_types = []  # type: List[str]
+        for aliquot, sample_type, tissue_type in samples:
+            aliquots.append(aliquot)
+            sample_types.append(sample_type)
+            tissue_types.append(tissue_type)
+        self._set_samples(row, aliquots, sample_types, tissue_types)
+
+    def add_api_hit(self, hit: Dict) -> None:
+        """Parse and add one hit from the /files endpoint; see add."""
+        case = hit["cases"][0]
+        row = self._set_row(
+            hit["file_id"],
+            hit["md5sum"],
+            hit["file_size"],
+            hit["created_datetime"],
+            case["case_id"],
+            case["project"]["project_id"],
+        )
+
+        # Keep one sample per aliquot submitter id. A repeated id keeps its
+        # first position but takes the types of its last sample.
+        slots = {}  # type: Dict[str, int]
+        aliquots = []  # type: List[str]
+        sample_types = []  # type: List[str]
+        tissue_types = []  # type: List[str]
+        for sample in case["samples"]:
+            aliquot = sample["portions"][0]["analytes"][0]["aliquots"][0][
+                "submitter_id"
+            ]
+            slot = slots.get(aliquot)
+            if slot is not None:
+                sample_types[slot] = sample["sample_type"]
+                tissue_types[slot] = sample["tissue_type"]
+                continue
+            slots[aliquot] = len(aliquots)
+            aliquots.append(aliquot)
+            sample_types.append(sample["sample_type"])
+            tissue_types.append(sample["tissue_type"])
+        self._set_samples(row, aliquots, sample_types, tissue_types)
+
+    def _set_row(
+        self,
+        file_id: str,
+        md5sum: str,
+        file_size: int,
+        created_datetime: str,
+        case_id: str,
+        project_id: str,
+    ) -> int:
+        """Set the columns of file_id's row, adding one with no samples if needed."""
+        # Changing a row invalidates the case and aliquot indexes.
+        self._by_case_id = None
+        self._by_aliquot = None
+
+        row = self._by_file_id.get(file_id)
+        if row is None:
+            row = len(self._file_ids)
+            self._by_file_id[file_id] = row
+            self._file_ids.append(file_id)
+            self._md5sums.append(md5sum)
+            self._file_sizes.append(file_size)
+            self._created_datetimes.append(created_datetime)
+            self._case_ids.append(case_id)
+            self._project_ids.append(project_id)
+            self._sample_starts.append(self._sample_starts[-1])
+            return row
+
+        self._md5sums[row] = md5sum
+        self._file_sizes[row] = file_size
+        self._created_datetimes[row] = created_datetime
+        self._case_ids[row] = case_id
+        self._project_ids[row] = project_id
+        return row
+
+    def _set_samples(
+        self,
+        row: int,
+        aliquots: List[str],
+        sample_types: List[str],
+        tissue_types: List[str],
+    ) -> None:
+        """Replace the samples of `row`.
+
+        For the last row this only appends. Replacing the samples of an earlier
+        row, i.e. a repeated file_id, shifts every later row's samples.
+        """
+        start = self._sample_starts[row]
+        end = self._sample_starts[row + 1]
+        self._aliquots[start:end] = aliquots
+        self._sample_types[start:end] = sample_types
+        self._tissue_types[start:end] = tissue_types
+        shift = len(aliquots) - (end - start)
+        if shift:
+            for i in range(row + 1, len(self._sample_starts)):
+                self._sample_starts[i] += shift
+
+    def _index_cases(self) -> None:
+        """Build the case_id index in one pass over the case_id column.
+
+        Rows sharing a case_id are chained through _next_in_case, starting at
+        the last such row.
+        """
+        if self._by_case_id is not None:
+            return
+
+        by_case_id = {}  # type: Dict[str, int]
+        next_in_case = array("q", bytes(8 * len(self._case_ids)))
+        for row, case_id in enumerate(self._case_ids):
+            next_in_case[row] = by_case_id.get(case_id, -1)
+            by_case_id[case_id] = row
+
+        self._next_in_case = next_in_case
+        self._by_case_id = by_case_id
+
+    def _index_aliquots(self) -> None:
+        """Build the aliquot index in one pass over the sample columns.
+
+        Samples sharing an aliquot are chained through _next_with_aliquot,
+        starting at the last such sample.
+        """
+        if self._by_aliquot is not None:
+            return
+
+        by_aliquot = {}  # type: Dict[str, int]
+        next_with_aliquot = array("q", bytes(8 * len(self._aliquots)))
+        sample_rows = array("q", bytes(8 * len(self._aliquots)))
+        starts = self._sample_starts
+        for row in range(len(self._file_ids)):
+            for slot in range(starts[row], starts[row + 1]):
+                aliquot = self._aliquots[slot]
+                sample_rows[slot] = row
+                next_with_aliquot[slot] = by_aliquot.get(aliquot, -1)
+                by_aliquot[aliquot] = slot
+
+        self._sample_rows = sample_rows
+        self._next_with_aliquot = next_with_aliquot
+        self._by_aliquot = by_aliquot
+
+    def _hit(self, row: int) -> Hit:
+        start = self._sample_starts[row]
+        end = self._sample_starts[row + 1]
+        return Hit(
+            self._file_ids[row],
+            self._md5sums[row],
+            self._file_sizes[row],
+            self._created_datetimes[row],
+            self._case_ids[row],
+            self._project_ids[row],
+            [
+                Sample(*s)
+                for s in zip(
+                    self._aliquots[start:end],
+                    self._sample_types[start:end],
+                    self._tissue_types[start:end],
+                )
+            ],
+        )
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    def __iter__(self) -> Iterator[Hit]:
+        return (self._hit(row) for row in range(len(self)))
+
+    def __getitem__(self, file_id: str) -> Hit:
+        return self._hit(self._by_file_id[file_id])
+
+    def __contains__(self, file_id: str) -> bool:
+        return file_id in self._by_file_id
+
+    def ids(self, key: str) -> KeysView:
+        """All the file_ids or case_ids in the store, as a set-like view."""
+        if key == "file_id":
+            return self._by_file_id.keys()
+        if key == "case_id":
+            self._index_cases()
+            return self._by_case_id.keys()
+        raise KeyError(key)
+
+    def by_case_id(self, case_id: str) -> List[Hit]:
+        self._index_cases()
+        rows = []
+        row = self._by_case_id.get(case_id, -1)
+        while row != -1:
+            rows.append(row)
+            row = self._next_in_case[row]
+        return [self._hit(row) for row in reversed(rows)]
+
+    def by_aliquot(self, aliquot_submitter_id: str) -> List[Hit]:
+        self._index_aliquots()
+        rows = []
+        slot = self._by_aliquot.get(aliquot_submitter_id, -1)
+        while slot != -1:
+            rows.append(self._sample_rows[slot])
+            slot = self._next_with_aliquot[slot]
+        return [self._hit(row) for row in reversed(rows)]
+
+    def project_ids(self) -> Set[str]:
+        return set(self._project_ids)
+
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """The stored hits as JSON serializable columns, e.g. for the metadata cache."""
+        return {
+            "file_id": self._file_ids,
+            "md5sum": self._md5sums,
+            "file_size": self._file_sizes.tolist(),
+            "created_datetime": self._created_datetimes,
+            "case_id": self._case_ids,
+            "project_id": self._project_ids,
+            "sample_start": self._sample_starts.tolist(),
+            "aliquot_submitter_id": self._aliquots,
+            "sample_type": self._sample_types,
+            "tissue_type": self._tissue_types,
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, List[Any]]) -> "HitStore":
+        store = cls()
+        starts = columns["sample_start"]
+        samples = list(
+            zip(
+                columns["aliquot_submitter_id"],
+                columns["sample_type"],
+                columns["tissue_type"],
+            )
+        )
+        for row, hit in enumerate(
+            zip(
+                columns["file_id"],
+                columns["md5sum"],
+                columns["file_size"],
+                columns["created_datetime"],
+                columns["case_id"],
+                columns["project_id"],
+            )
+        ):
+            store.add(*hit, samples[starts[row] : starts[row + 1]])
+        return store
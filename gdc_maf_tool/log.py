@@ -1,15 +1,29 @@
-import sys
+from typing import Dict, List, Sequence
 
 import cdislogging
 
 logger = cdislogging.get_logger("gdc-maf-tool", log_level="info")
 
 
-def fatal(message: str):
+class FatalError(SystemExit):
+    """Raised by fatal. Exits the program unless caught, e.g. by a serve mode job.
+
+    Attributes:
+        message: Why the program is exiting.
+        failed_downloads: Downloads that had failed by the time it exited.
+    """
+
+    def __init__(self, message: str, failed_downloads: Sequence[Dict[str, str]] = ()):
+        super().__init__(2)
+        self.message = message
+        self.failed_downloads = list(failed_downloads)  # type: List[Dict[str, str]]
+
+
+def fatal(message: str, failed_downloads: Sequence[Dict[str, str]] = ()):
     """
     Report the error and exit the program.
 
     Python's logger.fatal does not exit the program.
     """
     logger.fatal(message)
-    sys.exit(2)
+    raise FatalError(message, failed_downloads)
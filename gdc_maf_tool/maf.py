@@ -0,0 +1,146 @@
+import gzip
+import os
+import tempfile
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple
+
+# Header metadata written by aliquot_level_maf.aggregation.aggregate_mafs that
+# depends on which aliquots went into the MAF.
+ALIQUOTS_KEY = "tumor.aliquots.submitter_id"
+SAMPLE_COUNT_KEY = "n.analyzed.samples"
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class MafHeader(NamedTuple):
+    """The leading `#key value` comment lines and the column line of a MAF."""
+
+    comments: List[Tuple[str, bytes]]
+    columns: bytes
+
+    def get(self, key: str) -> Optional[str]:
+        for comment_key, line in self.comments:
+            if comment_key == key:
+                return line.decode().rstrip("\r\n").split(" ", 1)[-1]
+        return None
+
+    @property
+    def aliquots(self) -> List[str]:
+        value = self.get(ALIQUOTS_KEY)
+        return [a for a in value.split(",") if a] if value else []
+
+    def column_index(self, name: str) -> int:
+        """Raises ValueError if the MAF has no such column."""
+        return self.columns.decode().rstrip("\r\n").split("\t").index(name)
+
+
+def comment_key(line: bytes) -> str:
+    """The key of a `#key value` header line."""
+    return line[1:].decode().rstrip("\r\n").split(" ", 1)[0]
+
+
+def open_maf(path: str) -> BinaryIO:
+    """Open a MAF for reading, whether or not it's gzipped."""
+    with open(path, "rb") as f:
+        magic = f.read(2)
+    if magic == GZIP_MAGIC:
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def read_header(f: BinaryIO) -> MafHeader:
+    """Read up to and including the column line, leaving `f` at the first row."""
+    comments = []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("MAF has no column header line")
+        if not line.startswith(b"#"):
+            return MafHeader(comments, line)
+        comments.append((comment_key(line), line))
+
+
+def write_header(header: MafHeader, aliquots: List[str], output: BinaryIO) -> None:
+    """Write `header` with its aliquot metadata replaced by `aliquots`."""
+    for key, line in header.comments:
+        if key == ALIQUOTS_KEY:
+            line = "#{} {}\n".format(ALIQUOTS_KEY, ",".join(aliquots)).encode()
+        elif key == SAMPLE_COUNT_KEY:
+            line = "#{} {}\n".format(SAMPLE_COUNT_KEY, len(aliquots)).encode()
+        output.write(line)
+    output.write(header.columns)
+
+
+def _copy_rows(source: BinaryIO, output: BinaryIO, chunk_size: int = 1 << 20) -> None:
+    last = b""
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        output.write(chunk)
+        last = chunk
+    # Don't let the first row of the next MAF run onto the end of this one.
+    if last and not last.endswith(b"\n"):
+        output.write(b"\n")
+
+
+def merge_mafs(paths: List[str], output_filename: str) -> None:
+    """Combine aggregated MAFs (e.g. one per shard) into one gzipped MAF.
+
+    Comment lines are taken from the first MAF, except for the aliquot list
+    which is the union of every MAF's aliquots. Rows are written in the order
+    the MAFs are given, keeping each MAF's own row order. An aliquot may only
+    be in one of the MAFs, otherwise its rows would be written twice.
+
+    Every header is read before anything is written, and the output is
+    written to a temporary file that replaces `output_filename` once
+    complete, so a failed merge leaves no partial output behind.
+
+    Raises:
+        ValueError: The output is one of the MAFs, the MAFs don't have the
+            same columns, or an aliquot is in more than one of them.
+        OSError: A MAF can't be read or the output can't be written.
+    """
+    output = os.path.realpath(output_filename)
+    for path in paths:
+        if os.path.realpath(path) == output:
+            raise ValueError("{} is both an input and the output".format(path))
+
+    headers = []
+    for path in paths:
+        with open_maf(path) as f:
+            headers.append(read_header(f))
+
+    for path, header in zip(paths[1:], headers[1:]):
+        if header.columns != headers[0].columns:
+            raise ValueError("{} has different columns than {}".format(path, paths[0]))
+
+    aliquots = []  # type: List[str]
+    seen = {}  # type: Dict[str, str]
+    for path, header in zip(paths, headers):
+        for aliquot in header.aliquots:
+            if aliquot in seen:
+                raise ValueError(
+                    "Aliquot {} is in both {} and {}".format(
+                        aliquot, seen[aliquot], path
+                    )
+                )
+            seen[aliquot] = path
+            aliquots.append(aliquot)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(output), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb") as gz:
+            write_header(headers[0], aliquots, gz)
+            for path in paths:
+                with open_maf(path) as source:
+                    read_header(source)
+                    _copy_rows(source, gz)
+        # mkstemp creates the file readable by its owner only, but the output
+        # should get the same mode as any other file created here.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, output_filename)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
@@ -0,0 +1,84 @@
+import re
+import uuid
+from typing import Dict, List, NamedTuple, Optional
+
+from defusedcsv import csv
+
+from gdc_maf_tool import log
+from gdc_maf_tool.log import logger
+
+MD5_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ManifestEntry(NamedTuple):
+    """One row of a GDC manifest. Case manifests only have an id."""
+
+    id: str
+    md5: Optional[str] = None
+    size: Optional[int] = None
+
+
+def _parse_row(row: Dict[str, str]) -> ManifestEntry:
+    """Raises ValueError if any of the values are malformed."""
+    try:
+        entry_id = str(uuid.UUID(row["id"].strip()))
+    except ValueError:
+        raise ValueError("{} is not a UUID".format(row["id"]))
+
+    md5 = (row.get("md5") or "").strip().lower() or None
+    if md5 and not MD5_PATTERN.match(md5):
+        raise ValueError("{} is not an md5 checksum".format(md5))
+
+    size = (row.get("size") or "").strip() or None
+    if size and not size.isdigit():
+        raise ValueError("{} is not a file size".format(size))
+
+    return ManifestEntry(entry_id, md5, int(size) if size else None)
+
+
+def read_manifest(manifest_name: str) -> List[ManifestEntry]:
+    """Read and validate a GDC Manifest, keeping md5 and size when present.
+
+    Rows are read one at a time. Every id must be a UUID, and md5 and size,
+    where present, must be well formed; otherwise the program exits after
+    listing the bad rows. Repeated ids are dropped.
+    """
+    entries = {}  # type: Dict[str, ManifestEntry]
+    errors = []
+    duplicates = 0
+    with open(manifest_name) as f:
+        # Line 1 is the header.
+        for line, row in enumerate(csv.DictReader(f, delimiter="\t"), start=2):
+            if not row.get("id"):
+                continue
+            try:
+                entry = _parse_row(row)
+            except ValueError as e:
+                errors.append("line {}: {}".format(line, e))
+                continue
+
+            existing = entries.get(entry.id)
+            if existing is None:
+                entries[entry.id] = entry
+                continue
+            duplicates += 1
+            if existing != entry:
+                errors.append(
+                    "line {}: {} is listed again with a different md5 or size".format(
+                        line, entry.id
+                    )
+                )
+
+    if errors:
+        log.fatal(
+            "Invalid GDC Manifest {}:\n{}".format(manifest_name, "\n".join(errors))
+        )
+    if not entries:
+        log.fatal(
+            "Input must be valid GDC Manifest. For a valid manifest "
+            "visit https://portal.gdc.cancer.gov/"
+        )
+    if duplicates:
+        logger.warning("Ignoring %d repeated ids in %s", duplicates, manifest_name)
+
+    return list(entries.values())
@@ -0,0 +1,337 @@
+import collections
+import concurrent.futures
+import gzip
+import io
+import json
+import os
+import re
+import zlib
+from typing import BinaryIO, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from gdc_maf_tool import maf
+from gdc_maf_tool.log import logger
+
+SPLIT_MODES = ("chromosome", "rows")
+
+# Most bytes of rows per gzip member. Each member is compressed by a worker on
+# its own.
+CHUNK_BYTES = 4 << 20
+
+# Most bytes of rows buffered across every partition. Chromosome partitions all
+# fill at once, since an aggregated MAF is ordered by aliquot first, so a limit
+# per partition alone would still grow with the number of chromosomes.
+MAX_BUFFERED_BYTES = 64 << 20
+
+# The gzip command's default. aggregate_mafs already compresses at 9 on one
+# thread before the output is decompressed and partitioned, and 6 is several
+# times cheaper for output only a few percent larger.
+COMPRESS_LEVEL = 6
+
+
+class PartitionError(ValueError):
+    """The MAF can't be partitioned as asked."""
+
+
+class SplitOptions(NamedTuple):
+    """How to partition the aggregated MAF; see MafPartitioner."""
+
+    by: str
+    max_rows: int
+    workers: int
+
+
+def output_prefix(output_filename: str) -> str:
+    """Drop the .maf.gz (or .maf, or .gz) extension of the output file."""
+    for extension in (".gz", ".maf"):
+        if output_filename.endswith(extension):
+            output_filename = output_filename[: -len(extension)]
+    return output_filename
+
+
+class _Partition:
+    def __init__(self, path: str, chromosome: Optional[str] = None):
+        self.path = path
+        self.chromosome = chromosome
+        self.rows = 0
+        self.lines = []  # type: List[bytes]
+        # Bytes in lines.
+        self.size = 0
+        self.file = None  # type: Optional[BinaryIO]
+        # Chunks submitted for compression but not yet written.
+        self.pending = 0
+        # No more rows will be added.
+        self.complete = False
+
+    def to_dict(self) -> Dict:
+        entry = {"path": os.path.basename(self.path), "rows": self.rows}
+        if self.chromosome is not None:
+            entry["chromosome"] = self.chromosome
+        return entry
+
+
+# A compressed chunk on its way to a partition.
+_Chunk = Tuple[_Partition, concurrent.futures.Future]
+
+
+class MafPartitioner:
+    """Split an aggregated MAF into several gzipped MAFs, by chromosome or row count.
+
+    Rows are buffered per partition and handed to a pool of workers in chunks
+    of up to `chunk_bytes`. Once the buffers of all partitions together pass
+    `max_buffered_bytes`, the largest one is handed over early. Each chunk is
+    compressed into its own gzip member, and the members of each partition are
+    appended to its file in order, which is still a valid gzip file. Every
+    partition starts with the full header of the aggregated MAF.
+
+    Feed it the uncompressed MAF with `write` and call `close` to get the
+    manifest describing the partitions, or `abort` to give up and remove the
+    partitions written so far.
+
+    Attributes:
+        prefix: Partitions are written to `<prefix>.<partition>.maf.gz` and the
+            manifest to `<prefix>.manifest.json`.
+        by: "chromosome" or "rows".
+        max_rows: The most rows in one partition when splitting by rows.
+        chunk_bytes: The most bytes of rows in one gzip member.
+        max_buffered_bytes: The most bytes of rows buffered across partitions.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        by: str,
+        max_rows: int,
+        workers: int,
+        chunk_bytes: int = CHUNK_BYTES,
+        max_buffered_bytes: int = MAX_BUFFERED_BYTES,
+    ):
+        if by not in SPLIT_MODES:
+            raise ValueError("Can't split a MAF by {}".format(by))
+        self.prefix = prefix
+        self.by = by
+        self.max_rows = max_rows
+        self.chunk_bytes = chunk_bytes
+        self.max_buffered_bytes = max_buffered_bytes
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        # Bounds how many compressed chunks are held in memory at once.
+        self._max_pending = 2 * workers
+        self._pending = collections.deque()  # type: Deque[_Chunk]
+        self._partitions = collections.OrderedDict()  # type: Dict[str, _Partition]
+        self._buffered = 0
+        self._partial = b""
+        self._comments = []  # type: List[Tuple[str, bytes]]
+        self._header = None  # type: Optional[maf.MafHeader]
+        self._header_bytes = b""
+        self._chromosome_index = -1
+        self._rows = 0
+
+    def write(self, data: bytes) -> int:
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line + b"\n")
+        return len(data)
+
+    def _line(self, line: bytes) -> None:
+        if self._header is None:
+            self._header_line(line)
+            return
+        if not line.strip():
+            return
+
+        if self.by == "chromosome":
+            fields = line.split(b"\t", self._chromosome_index + 1)
+            if len(fields) <= self._chromosome_index:
+                raise PartitionError("Row {} has no Chromosome".format(self._rows + 1))
+            chromosome = fields[self._chromosome_index].rstrip(b"\r\n").decode()
+            partition = self._partition(chromosome, chromosome)
+        else:
+            number = self._rows // self.max_rows + 1
+            partition = self._partition("part-{:04d}".format(number))
+        self._rows += 1
+
+        partition.rows += 1
+        partition.lines.append(line)
+        partition.size += len(line)
+        self._buffered += len(line)
+        if partition.size >= self.chunk_bytes:
+            self._submit(partition)
+        elif self._buffered > self.max_buffered_bytes:
+            # The largest buffer holds at least this line, so this is enough
+            # to get back under the limit.
+            self._submit(max(self._partitions.values(), key=lambda p: p.size))
+
+    def _header_line(self, line: bytes) -> None:
+        if line.startswith(b"#"):
+            self._comments.append((maf.comment_key(line), line))
+            return
+
+        self._header = maf.MafHeader(self._comments, line)
+        self._header_bytes = b"".join(c for _, c in self._comments) + line
+        if self.by == "chromosome":
+            try:
+                self._chromosome_index = self._header.column_index("Chromosome")
+            except ValueError:
+                raise PartitionError("MAF has no Chromosome column")
+
+    def _partition(self, name: str, chromosome: Optional[str] = None) -> _Partition:
+        partition = self._partitions.get(name)
+        if partition is None:
+            # Chromosome names come from the data, so keep them filename safe.
+            safe_name = re.sub(r"[^\w.-]", "_", name)
+            path = "{}.{}.maf.gz".format(self.prefix, safe_name)
+            partition = _Partition(path, chromosome)
+            self._partitions[name] = partition
+
+            # Rows partitions fill up one after the other, so the previous
+            # one is complete as soon as the next one starts.
+            if self.by == "rows" and len(self._partitions) > 1:
+                self._complete(list(self._partitions.values())[-2])
+        return partition
+
+    def _complete(self, partition: _Partition) -> None:
+        partition.complete = True
+        if partition.lines or partition.file is None:
+            self._submit(partition)
+        elif not partition.pending:
+            partition.file.close()
+
+    def _submit(self, partition: _Partition) -> None:
+        content = b"".join(partition.lines)
+        if partition.file is None:
+            partition.file = open(partition.path, "wb")
+            content = self._header_bytes + content
+        partition.lines = []
+        self._buffered -= partition.size
+        partition.size = 0
+        partition.pending += 1
+        self._pending.append(
+            (partition, self._executor.submit(gzip.compress, content, COMPRESS_LEVEL))
+        )
+        while len(self._pending) > self._max_pending:
+            self._write_next()
+
+    def _write_next(self) -> None:
+        # Chunks are submitted in order, so writing the oldest first keeps
+        # every partition's chunks in order too.
+        partition, future = self._pending.popleft()
+        partition.file.write(future.result())
+        partition.pending -= 1
+        # Close complete partitions right away, there may be a lot of them.
+        if partition.complete and not partition.pending:
+            partition.file.close()
+
+    def close(self) -> str:
+        """Flush every partition, write the manifest and return its path.
+
+        Raises:
+            PartitionError: The MAF had no column header, or no Chromosome
+                column when splitting by chromosome.
+        """
+        try:
+            if self._partial:
+                self._line(self._partial + b"\n")
+                self._partial = b""
+            if self._header is None:
+                raise PartitionError("MAF has no column header line")
+
+            # Even an empty MAF gets a partition, so the header isn't lost.
+            if self.by == "rows" and not self._partitions:
+                self._partition("part-0001")
+            for partition in self._partitions.values():
+                if not partition.complete:
+                    self._complete(partition)
+            while self._pending:
+                self._write_next()
+        finally:
+            self._executor.shutdown()
+            for partition in self._partitions.values():
+                if partition.file:
+                    partition.file.close()
+
+        manifest_path = "{}.manifest.json".format(self.prefix)
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "split_by": self.by,
+                    "aliquots": self._header.aliquots,
+                    "rows": self._rows,
+                    "partitions": [p.to_dict() for p in self._partitions.values()],
+                },
+                f,
+                indent=2,
+            )
+        logger.info(
+            "Wrote %d partitions listed in %s", len(self._partitions), manifest_path
+        )
+        return manifest_path
+
+    def abort(self) -> None:
+        """Stop without writing a manifest and remove every partition file.
+
+        Safe to call after `close` raised.
+        """
+        for _, future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown()
+        for partition in self._partitions.values():
+            if partition.file:
+                partition.file.close()
+                try:
+                    os.remove(partition.path)
+                except FileNotFoundError:
+                    pass
+
+
+class GunzipWriter(io.RawIOBase):
+    """A writable file that passes what's written to `output`, decompressed.
+
+    aggregate_mafs writes a gzipped MAF; this lets it be partitioned as it's
+    written instead of being read back from disk. The aggregate MAF is still
+    compressed once on the calling thread, so splitting adds decompression
+    there and compression by the partitioner's workers. Data that isn't
+    gzipped is passed through unchanged.
+    """
+
+    def __init__(self, output: MafPartitioner):
+        self._output = output
+        self._decompressor = None
+        self._compressed = None  # type: Optional[bool]
+        self._start = b""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        size = len(data)
+        if self._compressed is None:
+            # Wait for enough bytes to tell whether this is gzip.
+            self._start += bytes(data)
+            if len(self._start) < len(maf.GZIP_MAGIC):
+                return size
+            data, self._start = self._start, b""
+            self._compressed = data.startswith(maf.GZIP_MAGIC)
+
+        if not self._compressed:
+            self._output.write(bytes(data))
+            return size
+
+        data = bytes(data)
+        while data:
+            if self._decompressor is None:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            self._output.write(self._decompressor.decompress(data))
+            # A new gzip member may follow the end of this one.
+            data = self._decompressor.unused_data
+            if self._decompressor.eof:
+                self._decompressor = None
+            else:
+                data = b""
+        return size
+
+    def close(self) -> None:
+        if self._start:
+            self._output.write(self._start)
+            self._start = b""
+        super().close()
@@ -0,0 +1,179 @@
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+
+from gdc_maf_tool.log import logger
+
+MODES = ("cpu", "memory")
+
+
+class _Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.nested = False
+        self.profile = None  # type: Optional[cProfile.Profile]
+        # Net bytes allocated per "file:line", summed over every call.
+        self.allocations = {}  # type: Dict[str, int]
+        # Most bytes allocated at once during any call, above what was
+        # allocated when it started.
+        self.peak = 0
+
+
+class Profiler:
+    """Time named stages of a run, and optionally profile their CPU or memory use.
+
+    Stages may nest. Only the outermost stage is profiled, since neither
+    cProfile nor tracemalloc can attribute work to two stages at once, but
+    nested stages are still timed. Calling a stage more than once adds to its
+    totals.
+
+    Memory profiles record the net allocations of each stage, and its peak,
+    since memory that is allocated and freed within a stage doesn't show in
+    the net allocations. The peak needs tracemalloc.reset_peak (Python 3.9);
+    without it a stage's peak can include that of earlier stages.
+
+    Attributes:
+        modes: Any of "cpu" and "memory".
+        directory: Where profile dumps and the summary are written.
+        top: Number of entries in each top-N listing.
+    """
+
+    def __init__(self, modes: List[str], directory: str, top: int = 25):
+        self.modes = modes
+        self.directory = directory
+        self.top = top
+        self._stages = {}  # type: Dict[str, _Stage]
+        self._active = []  # type: List[str]
+        if "memory" in modes:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stage = self._stages.setdefault(name, _Stage(name))
+        outermost = not self._active
+        stage.nested = stage.nested or not outermost
+        self._active.append(name)
+
+        before = None
+        if outermost and "memory" in self.modes:
+            before = tracemalloc.take_snapshot()
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        if outermost and "cpu" in self.modes:
+            stage.profile = stage.profile or cProfile.Profile()
+            stage.profile.enable()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage.seconds += time.perf_counter() - start
+            stage.calls += 1
+            if outermost and stage.profile:
+                stage.profile.disable()
+            if before is not None:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                stage.peak = max(stage.peak, peak)
+                after = tracemalloc.take_snapshot()
+                for stat in after.compare_to(before, "lineno"):
+                    frame = stat.traceback[0]
+                    line = "{}:{}".format(frame.filename, frame.lineno)
+                    stage.allocations[line] = (
+                        stage.allocations.get(line, 0) + stat.size_diff
+                    )
+            self._active.pop()
+
+    def finish(self) -> None:
+        """Write the per-stage dumps and a summary, and stop tracing memory."""
+        if "memory" in self.modes:
+            tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        memory = "memory" in self.modes
+        summary = [
+            "{:<24} {:>8} {:>12}{}".format(
+                "stage",
+                "calls",
+                "seconds",
+                " {:>12}".format("peak MiB") if memory else "",
+            )
+        ]
+        for stage in self._stages.values():
+            peak = ""
+            if memory and not stage.nested:
+                peak = " {:>12.1f}".format(stage.peak / 2 ** 20)
+            summary.append(
+                "{:<24} {:>8} {:>12.3f}{}{}".format(
+                    stage.name,
+                    stage.calls,
+                    stage.seconds,
+                    peak,
+                    " (nested, timed only)" if stage.nested else "",
+                )
+            )
+
+        for stage in self._stages.values():
+            if stage.profile:
+                stage.profile.dump_stats(self._path(stage, "prof"))
+                summary += [
+                    "",
+                    "== {}: top functions by cumulative time".format(stage.name),
+                ]
+                summary.append(self._top_functions(stage.profile))
+            if stage.allocations:
+                lines = self._top_allocations(stage)
+                with open(self._path(stage, "memory.txt"), "w") as f:
+                    f.write("\n".join(lines) + "\n")
+                summary += ["", "== {}: top net allocations".format(stage.name)]
+                summary += lines[: self.top]
+
+        with open(os.path.join(self.directory, "summary.txt"), "w") as f:
+            f.write("\n".join(summary) + "\n")
+        logger.info("Wrote profiles to %s", self.directory)
+
+    def _path(self, stage: _Stage, extension: str) -> str:
+        return os.path.join(self.directory, "{}.{}".format(stage.name, extension))
+
+    def _top_functions(self, profile: cProfile.Profile) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        return out.getvalue().strip()
+
+    def _top_allocations(self, stage: _Stage) -> List[str]:
+        ordered = sorted(stage.allocations.items(), key=lambda i: -abs(i[1]))
+        return ["{:>12.1f} KiB  {}".format(size / 1024, line) for line, size in ordered]
+
+
+_profiler = None  # type: Optional[Profiler]
+
+
+def enable(modes: List[str], directory: str, top: int = 25) -> None:
+    """Profile the stages of this run; see Profiler."""
+    global _profiler
+    _profiler = Profiler(modes, directory, top)
+
+
+def finish() -> None:
+    global _profiler
+    if _profiler:
+        _profiler.finish()
+        _profiler = None
+
+
+@contextlib.contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Mark a stage of the run. Does nothing unless profiling is enabled."""
+    if _profiler is None:
+        yield
+        return
+    with _profiler.stage(name):
+        yield
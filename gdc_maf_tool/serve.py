@@ -0,0 +1,275 @@
+import datetime
+import http.server
+import json
+import queue
+import socket
+import socketserver
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from gdc_maf_tool import log, partition
+from gdc_maf_tool.log import logger
+
+# Runs a job and returns its failed downloads.
+JobRunner = Callable[[Dict[str, Any]], List[Dict[str, str]]]
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Exactly one of these must be given per job, mirroring the -p/-f/-c CLI group.
+SOURCE_KEYS = ("project_id", "file_manifest", "case_manifest", "file_ids", "case_ids")
+OPTIONAL_KEYS = ("token",)
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+class Job:
+    """A single aggregation request and its progress.
+
+    Attributes:
+        id: Job id handed back to the submitter.
+        params: Validated job parameters passed to the runner. The token is
+            cleared once the job is done with.
+        status: One of queued, running, succeeded, failed or cancelled.
+        error: Reason the job failed, if it did.
+        failed_downloads: Files that could not be downloaded, and why. A job
+            succeeds even if some downloads failed, but not if all of them did.
+    """
+
+    def __init__(self, params: Dict[str, Any]):
+        self.id = str(uuid.uuid4())
+        self.params = params
+        self.status = QUEUED
+        self.error = None  # type: Optional[str]
+        self.failed_downloads = []  # type: List[Dict[str, str]]
+        self.submitted = _now()
+        self.started = None  # type: Optional[str]
+        self.finished = None  # type: Optional[str]
+
+    def to_dict(self) -> Dict[str, Any]:
+        # Never echo the token back.
+        params = {k: v for k, v in self.params.items() if k != "token"}
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "failed_downloads": self.failed_downloads,
+            "params": params,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+def validate_params(body: Any) -> Dict[str, Any]:
+    """Check a submitted job body and return the parameters for the runner.
+
+    Raises:
+        ValueError: The body is not a valid job description.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Job must be a JSON object")
+
+    unknown = set(body) - set(SOURCE_KEYS) - set(OPTIONAL_KEYS) - {"output"}
+    if unknown:
+        raise ValueError("Unknown job fields: {}".format(", ".join(sorted(unknown))))
+
+    sources = [k for k in SOURCE_KEYS if body.get(k)]
+    if len(sources) != 1:
+        raise ValueError(
+            "Job must have exactly one of: {}".format(", ".join(SOURCE_KEYS))
+        )
+
+    if not body.get("output") or not isinstance(body["output"], str):
+        raise ValueError("Job must have an output path")
+
+    params = {
+        "project_id": None,
+        "file_manifest": None,
+        "case_manifest": None,
+        "file_ids": [],
+        "case_ids": [],
+        "token": body.get("token"),
+        "output_filename": body["output"],
+        # Kept next to the output rather than shared by every job.
+        "failed_downloads_filename": "{}.failed-downloads.tsv".format(
+            partition.output_prefix(body["output"])
+        ),
+    }
+    source = sources[0]
+    if source in ("file_ids", "case_ids"):
+        if not isinstance(body[source], list):
+            raise ValueError("{} must be a list of UUIDs".format(source))
+        params[source] = [str(i) for i in body[source]]
+    else:
+        params[source] = str(body[source])
+    return params
+
+
+class JobQueue:
+    """Run submitted jobs one at a time on a background worker thread.
+
+    Jobs run sequentially so that they share the process-wide HTTP session
+    without competing for it, and so that a failing job never takes down the
+    process.
+    """
+
+    def __init__(self, runner: JobRunner):
+        self._runner = runner
+        self._queue = queue.Queue()  # type: queue.Queue
+        self._jobs = {}  # type: Dict[str, Job]
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._work, name="gdc-maf-tool-worker", daemon=True
+        )
+
+    def start(self) -> None:
+        self._worker.start()
+
+    def stop(self) -> None:
+        """Cancel the queued jobs, finish the running one and stop the worker."""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.status = CANCELLED
+                job.error = "The server shut down before the job started"
+                self._finish(job)
+        self._queue.put(None)
+        self._worker.join()
+
+    def submit(self, body: Any) -> Job:
+        job = Job(validate_params(body))
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        logger.info("Queued job %s", job.id)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self._run(job)
+
+    def _run(self, job: Job) -> None:
+        logger.info("Starting job %s", job.id)
+        job.status = RUNNING
+        job.started = _now()
+        try:
+            job.failed_downloads = self._runner(job.params) or []
+        except log.FatalError as e:
+            # log.fatal exits the program; in serve mode it only ends the job.
+            job.status = FAILED
+            job.error = e.message
+            job.failed_downloads = e.failed_downloads
+        except SystemExit as e:
+            job.status = FAILED
+            job.error = "Aggregation exited with status {}".format(e.code)
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status = FAILED
+            job.error = str(e)
+        else:
+            job.status = SUCCEEDED
+        self._finish(job)
+
+    def _finish(self, job: Job) -> None:
+        # Finished jobs are kept for their status, but not their token.
+        job.params["token"] = None
+        job.finished = _now()
+        logger.info("Finished job %s: %s", job.id, job.status)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = "gdc-maf-tool"
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            self._reply(200, [job.to_dict() for job in jobs.jobs()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = jobs.get(parts[1])
+            if job:
+                self._reply(200, job.to_dict())
+            else:
+                self._reply(404, {"error": "No such job {}".format(parts[1])})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            self._reply(404, {"error": "Not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            job = self.server.jobs.submit(json.loads(self.rfile.read(length)))
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        self._reply(202, job.to_dict())
+
+    def _reply(self, status: int, body: Any) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """Localhost HTTP API in front of a JobQueue.
+
+    POST /jobs submits a job, GET /jobs lists them and GET /jobs/<id> reports
+    the status of one job.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, runner: JobRunner, host: str, port: int):
+        if ":" in host:
+            self.address_family = socket.AF_INET6
+        super().__init__((host, port), _Handler)
+        self.jobs = JobQueue(runner)
+
+    def serve_forever(self, poll_interval=0.5):
+        self.jobs.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.jobs.stop()
+
+
+def serve(runner: JobRunner, host: str, port: int) -> None:
+    """Serve the job API until interrupted."""
+    server = Server(runner, host, port)
+    logger.info("Listening on http://%s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
@@ -5,6 +5,8 @@ import uuid
 import pytest
 import requests
 
+from gdc_maf_tool.hits import Hit, HitStore
+
 
 @pytest.fixture
 def fake_manifest(request):
@@ -24,13 +26,13 @@ def fake_manifest(request):
 
 
 @pytest.fixture
-def fake_hitmap():
+def fake_hit_store():
     case_ids = [str(uuid.uuid4()) for _ in range(5)]
     file_ids = [str(uuid.uuid4()) for _ in range(5)]
-    hit_map = {}
-    for file_id, case_id in zip(file_ids, case_ids):
-        hit_map.update({file_id: {"file_id": file_id, "case_id": case_id}})
-    return hit_map
+    return HitStore(
+        Hit(file_id, "", 0, "", case_id, "", ())
+        for file_id, case_id in zip(file_ids, case_ids)
+    )
 
 
 class FakeResponse(requests.Response):
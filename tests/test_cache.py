@@ -0,0 +1,96 @@
+import json
+
+import mock
+import pytest
+
+from gdc_maf_tool import cache
+
+FIELDS = ["file_id", "cases.case_id"]
+FILTERS = {
+    "op": "and",
+    "content": [
+        {"op": "in", "content": {"field": "files.data_format", "value": ["MAF"]}},
+        {"op": "in", "content": {"field": "files.file_id", "value": ["b", "a"]}},
+    ],
+}
+HITS = [{"file_id": "a", "case_id": "c"}]
+
+
+def test_cache_key__ignores_order():
+    reordered = {
+        "op": "and",
+        "content": [
+            {"op": "in", "content": {"field": "files.file_id", "value": ["a", "b"]}},
+            {"op": "in", "content": {"field": "files.data_format", "value": ["MAF"]}},
+        ],
+    }
+    assert cache.cache_key(FILTERS, FIELDS) == cache.cache_key(
+        reordered, list(reversed(FIELDS))
+    )
+    assert cache.cache_key(FILTERS, FIELDS) != cache.cache_key(FILTERS, ["file_id"])
+
+
+def test_metadata_cache__round_trip(tmp_path):
+    metadata_cache = cache.MetadataCache(str(tmp_path / "cache"))
+    key = cache.cache_key(FILTERS, FIELDS)
+
+    assert metadata_cache.get(key, "Data Release 1") is None
+    metadata_cache.put(key, HITS, "Data Release 1")
+    assert metadata_cache.get(key, "Data Release 1") == HITS
+    # An unknown release falls back to only checking the TTL.
+    assert metadata_cache.get(key, None) == HITS
+
+
+def test_metadata_cache__new_release(tmp_path):
+    metadata_cache = cache.MetadataCache(str(tmp_path))
+    metadata_cache.put("key", HITS, "Data Release 1")
+    assert metadata_cache.get("key", "Data Release 2") is None
+
+
+def test_metadata_cache__expired(tmp_path):
+    metadata_cache = cache.MetadataCache(str(tmp_path), ttl=60)
+    with mock.patch("time.time", return_value=1000):
+        metadata_cache.put("key", HITS, "Data Release 1")
+    with mock.patch("time.time", return_value=1059):
+        assert metadata_cache.get("key", "Data Release 1") == HITS
+    with mock.patch("time.time", return_value=1061):
+        assert metadata_cache.get("key", "Data Release 1") is None
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "{not json",
+        "[]",
+        '"hits"',
+        json.dumps({"version": cache.FORMAT_VERSION, "release": None, "hits": HITS}),
+        json.dumps({"version": cache.FORMAT_VERSION, "created": 1, "hits": HITS}),
+        json.dumps({"version": cache.FORMAT_VERSION, "created": 1, "release": None}),
+        json.dumps(
+            {
+                "version": cache.FORMAT_VERSION,
+                "created": "yesterday",
+                "release": None,
+                "hits": HITS,
+            }
+        ),
+    ],
+)
+def test_metadata_cache__corrupt_entry(tmp_path, content):
+    (tmp_path / "key.json").write_text(content)
+    assert cache.MetadataCache(str(tmp_path)).get("key", None) is None
+
+
+def test_metadata_cache__unwritable(tmp_path):
+    # The cache directory can't be created under a file.
+    (tmp_path / "file").write_text("")
+    metadata_cache = cache.MetadataCache(str(tmp_path / "file" / "cache"))
+    metadata_cache.put("key", HITS, "Data Release 1")
+    assert metadata_cache.get("key", "Data Release 1") is None
+
+
+def test_metadata_cache__failed_write(tmp_path):
+    metadata_cache = cache.MetadataCache(str(tmp_path))
+    with mock.patch("os.replace", side_effect=OSError("No space left on device")):
+        metadata_cache.put("key", HITS, "Data Release 1")
+    assert list(tmp_path.iterdir()) == []
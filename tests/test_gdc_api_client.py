@@ -5,19 +5,20 @@ import uuid
 import mock
 import pytest
 from defusedcsv import csv
-from httmock import HTTMock
+from httmock import HTTMock, urlmatch
 from tests import mocks
 
-from gdc_maf_tool import gdc_api_client
+from gdc_maf_tool import cache, gdc_api_client
+from gdc_maf_tool.manifest import ManifestEntry
 
 
 @pytest.mark.parametrize("hit_key", ["file_id", "case_id"])
-def test__check_for_missing_ids(fake_hitmap, hit_key):
+def test__check_for_missing_ids(fake_hit_store, hit_key):
 
     extra_uuid = str(uuid.uuid4())
-    expected_ids = [h[hit_key] for h in fake_hitmap.values()] + [extra_uuid]
+    expected_ids = [getattr(h, hit_key) for h in fake_hit_store] + [extra_uuid]
 
-    gdc_api_client.check_for_missing_ids(fake_hitmap, expected_ids, hit_key)
+    gdc_api_client.check_for_missing_ids(fake_hit_store, expected_ids, hit_key)
 
     # date = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     # filename = "failed-downloads-{}.tsv".format(date)
@@ -29,3 +30,130 @@ def test__check_for_missing_ids(fake_hitmap, hit_key):
         assert uuids[0] == extra_uuid
 
     os.remove(gdc_api_client.FAILED_DOWNLOAD_FILENAME)
+
+
+def test_shard__partitions_cases():
+    case_ids = [str(uuid.uuid4()) for _ in range(100)]
+    shards = [gdc_api_client.Shard(i, 3) for i in range(1, 4)]
+
+    for case_id in case_ids:
+        assert sum(case_id in shard for shard in shards) == 1
+    assert all(any(c in shard for c in case_ids) for shard in shards)
+
+
+def test_check_manifest_checksums(fake_hit_store):
+    hits = list(fake_hit_store)
+    file_manifest = [
+        # Agrees with the metadata.
+        ManifestEntry(hits[0].file_id, hits[0].md5sum or None, hits[0].file_size),
+        # No md5 or size to compare.
+        ManifestEntry(hits[1].file_id),
+        ManifestEntry(hits[2].file_id, "0" * 32),
+        ManifestEntry(hits[3].file_id, None, hits[3].file_size + 1),
+        # Not in the metadata, reported by check_for_missing_ids instead.
+        ManifestEntry(str(uuid.uuid4()), "0" * 32),
+    ]
+
+    mismatched = gdc_api_client.check_manifest_checksums(fake_hit_store, file_manifest)
+    assert mismatched == {hits[2].file_id, hits[3].file_id}
+
+    with open(gdc_api_client.FAILED_DOWNLOAD_FILENAME) as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert {r["file_id"] for r in rows} == mismatched
+    assert {r["case_id"] for r in rows} == {hits[2].case_id, hits[3].case_id}
+
+    os.remove(gdc_api_client.FAILED_DOWNLOAD_FILENAME)
+
+
+def files_hit(file_id):
+    aliquot = {"submitter_id": "aliquot-{}".format(file_id)}
+    return {
+        "file_id": file_id,
+        "md5sum": "0" * 32,
+        "file_size": 1,
+        "created_datetime": "2020-03-17T21:24:16.127588-05:00",
+        "cases": [
+            {
+                "case_id": "case-{}".format(file_id),
+                "project": {"project_id": "TCGA-X"},
+                "samples": [
+                    {
+                        "sample_type": "Primary Tumor",
+                        "tissue_type": "Tumor",
+                        "portions": [{"analytes": [{"aliquots": [aliquot]}]}],
+                    }
+                ],
+            }
+        ],
+    }
+
+
+@pytest.fixture
+def gdc_api(request):
+    """Mock /files and /status. Set api["release"] to None to fail /status."""
+    api = {"release": "Data Release 1", "hits": [files_hit("a"), files_hit("b")]}
+
+    @urlmatch(path="/files$")
+    def files_mock(url, request):
+        data = {"hits": api["hits"], "pagination": {"page": 1, "pages": 1}}
+        return {"status_code": 200, "content": {"data": data}}
+
+    @urlmatch(path="/status$")
+    def status_mock(url, request):
+        if api["release"] is None:
+            return {"status_code": 500, "content": "unavailable"}
+        return {"status_code": 200, "content": {"data_release": api["release"]}}
+
+    with HTTMock(files_mock, status_mock), mock.patch.object(
+        gdc_api_client, "_files_query", wraps=gdc_api_client._files_query
+    ) as files_query:
+        api["files_query"] = files_query
+        yield api
+
+
+def query(metadata_cache):
+    hit_store = gdc_api_client.query_hits("TCGA-X", [], [], cache=metadata_cache)
+    return sorted(hit.file_id for hit in hit_store)
+
+
+def test_query_hits__cached(tmp_path, gdc_api):
+    metadata_cache = cache.MetadataCache(str(tmp_path))
+
+    assert query(metadata_cache) == ["a", "b"]
+    gdc_api["hits"] = [files_hit("c")]
+    assert query(metadata_cache) == ["a", "b"]
+    assert gdc_api["files_query"].call_count == 1
+
+
+def test_query_hits__new_release(tmp_path, gdc_api):
+    metadata_cache = cache.MetadataCache(str(tmp_path))
+
+    assert query(metadata_cache) == ["a", "b"]
+    gdc_api["release"] = "Data Release 2"
+    gdc_api["hits"] = [files_hit("c")]
+    assert query(metadata_cache) == ["c"]
+    assert gdc_api["files_query"].call_count == 2
+
+
+def test_query_hits__status_unavailable(tmp_path, gdc_api):
+    metadata_cache = cache.MetadataCache(str(tmp_path), ttl=60)
+    with mock.patch("time.time", return_value=1000):
+        assert query(metadata_cache) == ["a", "b"]
+
+    # Without the current release only the TTL is checked.
+    gdc_api["release"] = None
+    gdc_api["hits"] = [files_hit("c")]
+    with mock.patch("time.time", return_value=1059):
+        assert query(metadata_cache) == ["a", "b"]
+    assert gdc_api["files_query"].call_count == 1
+
+    with mock.patch("time.time", return_value=1061):
+        assert query(metadata_cache) == ["c"]
+    assert gdc_api["files_query"].call_count == 2
+
+
+def test_query_hits__malformed_cached_hits(tmp_path, gdc_api):
+    metadata_cache = cache.MetadataCache(str(tmp_path))
+    with mock.patch.object(metadata_cache, "get", return_value={"file_id": []}):
+        assert query(metadata_cache) == ["a", "b"]
+    assert gdc_api["files_query"].call_count == 1
@@ -1,11 +1,8 @@
 from httmock import HTTMock
 from tests import mocks
 
-from gdc_maf_tool.gdc_api_client import (
-    _build_hit_map,
-    _parse_hit,
-    _select_mafs,
-)
+from gdc_maf_tool.gdc_api_client import _select_mafs
+from gdc_maf_tool.hits import HitStore, Sample
 
 
 def test__select_mafs():
@@ -123,9 +120,19 @@ def test__select_mafs():
             },
         },
     }
+    hit_store = HitStore()
+    for hit in results["data"]["hits"]:
+        hit_store.add_api_hit(hit)
     with HTTMock(mocks.download_mock):
-        mafs = _select_mafs(
-            _build_hit_map([_parse_hit(hit) for hit in results["data"]["hits"]]),
-            mocks.VALID_TOKEN,
-        )
+        mafs = _select_mafs(hit_store, mocks.VALID_TOKEN)
     assert mafs[0].tumor_aliquot_submitter_id == "TARGET-20-PANLRE-09A-01D"
+
+
+def test__select_mafs__excluded_primary_aliquot_is_not_replaced():
+    samples = [Sample("ALIQUOT-01A", "Primary Tumor", "Tumor")]
+    hit_store = HitStore()
+    hit_store.add("file-1", "md5-1", 1, "2020-01-01", "case-1", "TCGA-X", samples)
+    hit_store.add("file-2", "md5-2", 1, "2019-01-01", "case-1", "TCGA-X", samples)
+
+    # file-1 is the case's primary aliquot, so excluding it drops the case.
+    assert _select_mafs(hit_store, mocks.VALID_TOKEN, exclude={"file-1"}) == []
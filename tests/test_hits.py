@@ -0,0 +1,119 @@
+import json
+
+from gdc_maf_tool.hits import HitStore, Sample
+
+
+def raw_hit(file_id, case_id, aliquots):
+    return {
+        "file_id": file_id,
+        "md5sum": "md5-" + file_id,
+        "file_size": 10,
+        "created_datetime": "2020-03-17T21:24:16.127588-05:00",
+        "cases": [
+            {
+                "case_id": case_id,
+                "project": {"project_id": "TARGET-AML"},
+                "samples": [
+                    {
+                        "sample_type": sample_type,
+                        "tissue_type": "Not Reported",
+                        "portions": [
+                            {"analytes": [{"aliquots": [{"submitter_id": aliquot}]}]}
+                        ],
+                    }
+                    for aliquot, sample_type in aliquots
+                ],
+            }
+        ],
+    }
+
+
+def build_store(*raw_hits):
+    store = HitStore()
+    for hit in raw_hits:
+        store.add_api_hit(hit)
+    return store
+
+
+def test_hit_store__add_api_hit():
+    store = build_store(
+        raw_hit(
+            "file-1",
+            "case-1",
+            [
+                ("A-01", "Primary Tumor"),
+                ("A-10", "Blood Derived Normal"),
+                ("A-01", "Recurrent Tumor"),
+            ],
+        )
+    )
+    hit = store["file-1"]
+    assert hit.md5sum == "md5-file-1"
+    assert hit.case_id == "case-1"
+    assert hit.project_id == "TARGET-AML"
+    # A repeated aliquot keeps its first position and its last sample's types.
+    assert [s.aliquot_submitter_id for s in hit.samples] == ["A-01", "A-10"]
+    assert [s.sample_type for s in hit.samples] == [
+        "Recurrent Tumor",
+        "Blood Derived Normal",
+    ]
+
+
+def test_hit_store__indexes():
+    normal = ("A-10", "Blood Derived Normal")
+    store = build_store(
+        raw_hit("file-1", "case-1", [("A-01", "Primary Tumor"), normal]),
+        raw_hit("file-2", "case-1", [("A-02", "Recurrent Tumor"), normal]),
+        raw_hit("file-3", "case-2", [("B-01", "Primary Tumor")]),
+        raw_hit("file-3", "case-2", [("B-01", "Primary Tumor")]),
+    )
+
+    assert len(store) == 3
+    assert "file-2" in store
+    assert [h.file_id for h in store] == ["file-1", "file-2", "file-3"]
+    assert set(store.ids("file_id")) == {"file-1", "file-2", "file-3"}
+    assert {"case-1", "case-3"} - store.ids("case_id") == {"case-3"}
+    assert [h.file_id for h in store.by_case_id("case-1")] == ["file-1", "file-2"]
+    assert [h.file_id for h in store.by_aliquot("A-10")] == ["file-1", "file-2"]
+    assert [h.file_id for h in store.by_aliquot("B-01")] == ["file-3"]
+    assert store.by_aliquot("missing") == []
+    assert store.project_ids() == {"TARGET-AML"}
+
+    # Adding a hit after the indexes were built updates them.
+    store.add("file-4", "", 0, "", "case-2", "TARGET-AML", [Sample(*normal, "")])
+    assert [h.file_id for h in store.by_case_id("case-2")] == ["file-3", "file-4"]
+    assert len(store.by_aliquot("A-10")) == 3
+
+
+def test_hit_store__repeated_file_id():
+    store = build_store(
+        raw_hit("file-1", "case-1", [("A-01", "Primary Tumor")]),
+        raw_hit("file-2", "case-2", [("B-01", "Primary Tumor")]),
+        raw_hit("file-1", "case-3", [("C-01", "Recurrent Tumor"), ("C-10", "Normal")]),
+    )
+
+    # The last hit wins, in the position of the first.
+    assert [h.file_id for h in store] == ["file-1", "file-2"]
+    hit = store["file-1"]
+    assert hit.case_id == "case-3"
+    assert [s.aliquot_submitter_id for s in hit.samples] == ["C-01", "C-10"]
+    assert [s.aliquot_submitter_id for s in store["file-2"].samples] == ["B-01"]
+    assert [h.file_id for h in store.by_aliquot("B-01")] == ["file-2"]
+    assert store.by_aliquot("A-01") == []
+    assert store.by_case_id("case-1") == []
+
+
+def test_hit_store__ids_only_indexes_cases():
+    store = build_store(raw_hit("file-1", "case-1", [("A-01", "Primary Tumor")]))
+    assert set(store.ids("case_id")) == {"case-1"}
+    assert store._by_aliquot is None
+
+
+def test_hit_store__columns_round_trip():
+    store = build_store(
+        raw_hit("file-1", "case-1", [("A-01", "Primary Tumor")]),
+        raw_hit("file-2", "case-2", []),
+        raw_hit("file-3", "case-3", [("C-01", "Primary Tumor"), ("C-10", "Normal")]),
+    )
+    copy = HitStore.from_columns(json.loads(json.dumps(store.to_columns())))
+    assert list(copy) == list(store)
@@ -0,0 +1,86 @@
+import gzip
+import os
+import stat
+
+import pytest
+
+from gdc_maf_tool import maf
+
+COLUMNS = b"Hugo_Symbol\tChromosome\tTumor_Sample_Barcode\n"
+
+
+def write_maf(path, aliquots, rows, compress=True):
+    content = (
+        b"#version gdc-1.0.0\n"
+        + "#n.analyzed.samples {}\n".format(len(aliquots)).encode()
+        + "#tumor.aliquots.submitter_id {}\n".format(",".join(aliquots)).encode()
+        + COLUMNS
+        + b"".join(rows)
+    )
+    opener = gzip.open if compress else open
+    with opener(str(path), "wb") as f:
+        f.write(content)
+    return str(path)
+
+
+def test_merge_mafs(tmp_path):
+    first = write_maf(
+        tmp_path / "1.maf.gz", ["A", "B"], [b"G1\tchr1\tA\n", b"G2\tchr2\tB\n"]
+    )
+    # Not gzipped, and missing a trailing newline.
+    second = write_maf(tmp_path / "2.maf", ["C"], [b"G3\tchr1\tC"], False)
+
+    output = tmp_path / "merged.maf.gz"
+    maf.merge_mafs([first, second], str(output))
+
+    with maf.open_maf(str(output)) as f:
+        header = maf.read_header(f)
+        rows = f.read()
+
+    assert header.aliquots == ["A", "B", "C"]
+    assert header.get(maf.SAMPLE_COUNT_KEY) == "3"
+    assert header.get("version") == "gdc-1.0.0"
+    assert header.columns == COLUMNS
+    assert rows == b"G1\tchr1\tA\nG2\tchr2\tB\nG3\tchr1\tC\n"
+
+
+def test_merge_mafs__different_columns(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A"], [])
+    second = tmp_path / "2.maf"
+    second.write_bytes(b"#tumor.aliquots.submitter_id B\nHugo_Symbol\n")
+
+    with pytest.raises(ValueError):
+        maf.merge_mafs([first, str(second)], str(tmp_path / "merged.maf.gz"))
+    # Neither the output nor its temporary file is left behind.
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["1.maf.gz", "2.maf"]
+
+
+def test_merge_mafs__output_is_input(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A"], [b"G1\tchr1\tA\n"])
+    second = write_maf(tmp_path / "2.maf.gz", ["B"], [b"G2\tchr1\tB\n"])
+    content = (tmp_path / "1.maf.gz").read_bytes()
+
+    with pytest.raises(ValueError):
+        maf.merge_mafs([first, second], str(tmp_path / "." / "1.maf.gz"))
+    assert (tmp_path / "1.maf.gz").read_bytes() == content
+
+
+def test_merge_mafs__overlapping_aliquots(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A", "B"], [b"G1\tchr1\tB\n"])
+    second = write_maf(tmp_path / "2.maf.gz", ["B", "C"], [b"G1\tchr1\tB\n"])
+
+    with pytest.raises(ValueError, match="Aliquot B"):
+        maf.merge_mafs([first, second], str(tmp_path / "merged.maf.gz"))
+    assert not (tmp_path / "merged.maf.gz").exists()
+
+
+def test_merge_mafs__output_mode(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A"], [])
+    output = tmp_path / "merged.maf.gz"
+
+    umask = os.umask(0o022)
+    try:
+        maf.merge_mafs([first], str(output))
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(output.stat().st_mode) == 0o644
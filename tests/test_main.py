@@ -1,4 +1,14 @@
-from gdc_maf_tool import cli
+import argparse
+import gzip
+import json
+import types
+
+import mock
+import pytest
+from defusedcsv import csv
+from tests.test_maf import write_maf
+
+from gdc_maf_tool import cli, log, maf, partition
 
 
 def test_ids_from_manifest(fake_manifest):
@@ -6,3 +16,141 @@ def test_ids_from_manifest(fake_manifest):
     ids = cli.ids_from_manifest(filename)
 
     assert ids == expected_ids
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "127.0.0.2", "::1", "localhost"])
+def test_loopback_host(host):
+    assert cli.loopback_host(host) == host
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", "::", "10.0.0.1", "example.com"])  # nosec
+def test_loopback_host__refuses_others(host):
+    with pytest.raises(argparse.ArgumentTypeError):
+        cli.loopback_host(host)
+
+
+def fake_maf(file_id, failed_reason=None):
+    return types.SimpleNamespace(
+        file=types.SimpleNamespace(
+            case_id="case-" + file_id, uuid=file_id, failed_reason=failed_reason
+        )
+    )
+
+
+def run_aggregate(tmp_path, mafs, split=None, content=b"", error=None):
+    failed_downloads_filename = str(tmp_path / "failed.tsv")
+
+    def aggregate_mafs(mafs, f):
+        f.write(gzip.compress(content))
+        if error:
+            raise error
+
+    with mock.patch.object(
+        cli.gdc_api_client, "collect_mafs", return_value=mafs
+    ), mock.patch.object(cli, "aggregate_mafs", aggregate_mafs):
+        failed = cli.aggregate(
+            "TCGA-X",
+            [],
+            [],
+            None,
+            str(tmp_path / "out.maf.gz"),
+            split=split,
+            failed_downloads_filename=failed_downloads_filename,
+        )
+    return failed, failed_downloads_filename
+
+
+def test_aggregate__returns_failed_downloads(tmp_path):
+    mafs = [fake_maf("a"), fake_maf("b", "Not authorized")]
+    failed, failed_downloads_filename = run_aggregate(tmp_path, mafs)
+
+    assert failed == [{"case_id": "case-b", "file_id": "b", "reason": "Not authorized"}]
+    with open(failed_downloads_filename) as f:
+        rows = list(csv.DictReader(f, delimiter="\t"))
+    assert [r["file_id"] for r in rows] == ["b"]
+
+
+def test_aggregate__all_downloads_failed(tmp_path):
+    mafs = [fake_maf("a", "File not found"), fake_maf("b", "Not authorized")]
+    with pytest.raises(log.FatalError) as e:
+        run_aggregate(tmp_path, mafs)
+    assert [f["file_id"] for f in e.value.failed_downloads] == ["a", "b"]
+
+
+def test_aggregate__split(tmp_path):
+    content = (
+        b"#tumor.aliquots.submitter_id A\n"
+        b"Hugo_Symbol\tChromosome\n"
+        b"G1\tchr1\nG2\tchr2\nG3\tchr1\n"
+    )
+    split = partition.SplitOptions("chromosome", 10, 2)
+    run_aggregate(tmp_path, [fake_maf("a")], split, content)
+
+    assert not (tmp_path / "out.maf.gz").exists()
+    with open(str(tmp_path / "out.manifest.json")) as f:
+        manifest = json.load(f)
+    assert [p["rows"] for p in manifest["partitions"]] == [2, 1]
+    with maf.open_maf(str(tmp_path / "out.chr1.maf.gz")) as f:
+        maf.read_header(f)
+        assert f.read() == b"G1\tchr1\nG3\tchr1\n"
+
+
+def test_aggregate__split_fails(tmp_path):
+    split = partition.SplitOptions("chromosome", 10, 2)
+    with pytest.raises(log.FatalError) as e:
+        run_aggregate(tmp_path, [fake_maf("a")], split, b"Hugo_Symbol\nG1\n")
+    assert e.value.message == (
+        "Unable to split the aggregate MAF: MAF has no Chromosome column"
+    )
+
+
+def test_aggregate__split_aborts(tmp_path):
+    # Enough rows for a partition to be written before the failure.
+    rows = partition.CHUNK_BYTES // len(b"G1\tchr1\n") + 1
+    content = b"Hugo_Symbol\tChromosome\n" + b"G1\tchr1\n" * rows
+    split = partition.SplitOptions("chromosome", 10, 2)
+    with pytest.raises(ValueError):
+        run_aggregate(
+            tmp_path, [fake_maf("a")], split, content, ValueError("Failed checksum")
+        )
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_main__merge(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A"], [b"G1\tchr1\tA\n"])
+    second = write_maf(tmp_path / "2.maf.gz", ["B"], [b"G2\tchr1\tB\n"])
+    output = str(tmp_path / "merged.maf.gz")
+
+    cli.main(["merge", first, second, "-o", output])
+
+    with maf.open_maf(output) as f:
+        assert maf.read_header(f).aliquots == ["A", "B"]
+        assert f.read() == b"G1\tchr1\tA\nG2\tchr1\tB\n"
+
+
+def test_main__merge_fails(tmp_path):
+    first = write_maf(tmp_path / "1.maf.gz", ["A"], [b"G1\tchr1\tA\n"])
+    content = (tmp_path / "1.maf.gz").read_bytes()
+
+    # A missing input, and an output that is also an input.
+    with pytest.raises(SystemExit):
+        cli.main(
+            [
+                "merge",
+                first,
+                str(tmp_path / "missing.maf.gz"),
+                "-o",
+                str(tmp_path / "out.maf.gz"),
+            ]
+        )
+    with pytest.raises(SystemExit):
+        cli.main(["merge", first, first, "-o", first])
+
+    assert [p.name for p in tmp_path.iterdir()] == ["1.maf.gz"]
+    assert (tmp_path / "1.maf.gz").read_bytes() == content
+
+
+@pytest.mark.parametrize("top", ["0", "-1"])
+def test_parse_args__profile_top(top):
+    with pytest.raises(SystemExit):
+        cli.parse_args(["-p", "TCGA-X", "--profile", "memory", "--profile-top", top])
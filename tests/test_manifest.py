@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+from gdc_maf_tool import manifest
+
+MD5 = "d8ab26d704d5d89a5356609ec42c2691"
+
+
+def write(tmp_path, lines):
+    path = tmp_path / "manifest.tsv"
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
+
+
+def test_read_manifest(tmp_path):
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    path = write(
+        tmp_path,
+        [
+            "id\tfilename\tmd5\tsize\tstate",
+            "{}\ta.maf.gz\t{}\t4771\treleased".format(first, MD5.upper()),
+            "{}\tb.maf.gz\t\t\treleased".format(second),
+            "{}\ta.maf.gz\t{}\t4771\treleased".format(first, MD5),
+        ],
+    )
+    assert manifest.read_manifest(path) == [
+        manifest.ManifestEntry(first, MD5, 4771),
+        manifest.ManifestEntry(second, None, None),
+    ]
+
+
+def test_read_manifest__ids_only(fake_manifest):
+    filename, expected_ids = fake_manifest
+    entries = manifest.read_manifest(filename)
+    assert [e.id for e in entries] == expected_ids
+    assert all(e.md5 is None and e.size is None for e in entries)
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        "not-a-uuid\t{}\t1".format(MD5),
+        "{}\tnot-an-md5\t1".format(uuid.uuid4()),
+        "{}\t{}\t-1".format(uuid.uuid4(), MD5),
+    ],
+)
+def test_read_manifest__invalid_row(tmp_path, row):
+    path = write(
+        tmp_path, ["id\tmd5\tsize", "{}\t{}\t1".format(uuid.uuid4(), MD5), row]
+    )
+    with pytest.raises(SystemExit):
+        manifest.read_manifest(path)
+
+
+def test_read_manifest__conflicting_duplicate(tmp_path):
+    file_id = str(uuid.uuid4())
+    path = write(
+        tmp_path,
+        [
+            "id\tmd5\tsize",
+            "{}\t{}\t1".format(file_id, MD5),
+            "{}\t{}\t2".format(file_id, MD5),
+        ],
+    )
+    with pytest.raises(SystemExit):
+        manifest.read_manifest(path)
+
+
+def test_read_manifest__no_ids(tmp_path):
+    with pytest.raises(SystemExit):
+        manifest.read_manifest(write(tmp_path, ["filename", "a.maf.gz"]))
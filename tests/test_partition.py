@@ -0,0 +1,150 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from gdc_maf_tool import maf, partition
+
+HEADER = (
+    b"#version gdc-1.0.0\n"
+    b"#tumor.aliquots.submitter_id A,B\n"
+    # Chromosome last, so that it's followed by the newline.
+    b"Hugo_Symbol\tTumor_Sample_Barcode\tChromosome\n"
+)
+ROWS = [
+    "G{}\t{}\tchr{}\n".format(i, "AB"[i % 2], ["1", "2", "X"][i % 3]).encode()
+    for i in range(25)
+]
+
+
+def write_in_pieces(partitioner, content, size=7):
+    with partition.GunzipWriter(partitioner) as f:
+        for i in range(0, len(content), size):
+            f.write(content[i : i + size])
+    return partitioner.close()
+
+
+def read_partitions(manifest_path):
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    directory = os.path.dirname(manifest_path)
+    contents = []
+    for entry in manifest["partitions"]:
+        with maf.open_maf(os.path.join(directory, entry["path"])) as f:
+            header = maf.read_header(f)
+            contents.append((header, f.read()))
+    return manifest, contents
+
+
+# Several gzip members per partition.
+SMALL_CHUNK = 2 * len(ROWS[0])
+
+
+def test_split_by_chromosome(tmp_path):
+    prefix = str(tmp_path / "out")
+    manifest_path = write_in_pieces(
+        partition.MafPartitioner(
+            prefix, "chromosome", 0, workers=3, chunk_bytes=SMALL_CHUNK
+        ),
+        gzip.compress(HEADER + b"".join(ROWS)),
+    )
+    assert manifest_path == prefix + ".manifest.json"
+
+    manifest, contents = read_partitions(manifest_path)
+    assert manifest["aliquots"] == ["A", "B"]
+    assert manifest["rows"] == len(ROWS)
+    assert [p["chromosome"] for p in manifest["partitions"]] == ["chr1", "chr2", "chrX"]
+    assert manifest["partitions"][0]["path"] == "out.chr1.maf.gz"
+
+    for entry, (header, rows) in zip(manifest["partitions"], contents):
+        assert header.aliquots == ["A", "B"]
+        chromosome = entry["chromosome"].encode()
+        expected = [r for r in ROWS if r.endswith(b"\t" + chromosome + b"\n")]
+        assert rows == b"".join(expected)
+        assert entry["rows"] == len(expected)
+
+
+def test_split_by_rows(tmp_path):
+    # Not gzipped, and missing the trailing newline.
+    content = HEADER + b"".join(ROWS)[:-1]
+    manifest_path = write_in_pieces(
+        partition.MafPartitioner(
+            str(tmp_path / "out"), "rows", 10, workers=2, chunk_bytes=SMALL_CHUNK
+        ),
+        content,
+    )
+
+    manifest, contents = read_partitions(manifest_path)
+    assert [p["rows"] for p in manifest["partitions"]] == [10, 10, 5]
+    assert [p["path"] for p in manifest["partitions"]] == [
+        "out.part-0001.maf.gz",
+        "out.part-0002.maf.gz",
+        "out.part-0003.maf.gz",
+    ]
+    assert b"".join(rows for _, rows in contents) == b"".join(ROWS)
+
+
+def test_split_by_chromosome__buffer_limit(tmp_path):
+    # Every row is on a different chromosome than the one before it, and no
+    # partition ever fills a chunk, so only the overall limit flushes rows.
+    rows = [
+        "{:<30}\tA\tchr{}\n".format("G{}".format(i), i % 20 + 1).encode()
+        for i in range(400)
+    ]
+    limit = 300
+    partitioner = partition.MafPartitioner(
+        str(tmp_path / "out"),
+        "chromosome",
+        0,
+        workers=2,
+        chunk_bytes=10 * limit,
+        max_buffered_bytes=limit,
+    )
+    partitioner.write(HEADER)
+    for row in rows:
+        partitioner.write(row)
+        buffered = sum(len(b"".join(p.lines)) for p in partitioner._partitions.values())
+        assert buffered <= limit
+
+    manifest, contents = read_partitions(partitioner.close())
+    assert len(manifest["partitions"]) == 20
+    for entry, (_, content) in zip(manifest["partitions"], contents):
+        chromosome = entry["chromosome"].encode()
+        expected = [r for r in rows if b"\t" + chromosome + b"\n" in r]
+        assert content == b"".join(expected)
+
+
+def test_abort(tmp_path):
+    partitioner = partition.MafPartitioner(
+        str(tmp_path / "out"), "chromosome", 0, workers=2, chunk_bytes=SMALL_CHUNK
+    )
+    partitioner.write(HEADER + b"".join(ROWS))
+    assert os.listdir(str(tmp_path))
+
+    partitioner.abort()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_split_by_rows__no_rows(tmp_path):
+    manifest_path = write_in_pieces(
+        partition.MafPartitioner(str(tmp_path / "out"), "rows", 10, workers=1),
+        gzip.compress(HEADER),
+    )
+    manifest, contents = read_partitions(manifest_path)
+    assert len(manifest["partitions"]) == 1
+    assert contents[0][1] == b""
+
+
+def test_split_by_chromosome__no_column(tmp_path):
+    partitioner = partition.MafPartitioner(str(tmp_path / "out"), "chromosome", 0, 1)
+    with pytest.raises(partition.PartitionError):
+        write_in_pieces(partitioner, b"Hugo_Symbol\n")
+
+
+@pytest.mark.parametrize(
+    "filename,prefix",
+    [("out.maf.gz", "out"), ("dir/out.maf", "dir/out"), ("out.tsv", "out.tsv")],
+)
+def test_output_prefix(filename, prefix):
+    assert partition.output_prefix(filename) == prefix
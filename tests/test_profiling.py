@@ -0,0 +1,71 @@
+import os
+import pstats
+
+from gdc_maf_tool import profiling
+
+
+def work():
+    return [str(i) * 10 for i in range(10000)]
+
+
+def test_stage__disabled():
+    with profiling.stage("anything"):
+        work()
+
+
+def test_profiler(tmp_path):
+    directory = str(tmp_path / "profile")
+    profiling.enable(["cpu", "memory"], directory, top=5)
+    try:
+        for _ in range(2):
+            with profiling.stage("outer"):
+                with profiling.stage("inner"):
+                    kept = work()
+    finally:
+        profiling.finish()
+
+    assert kept
+    assert sorted(os.listdir(directory)) == [
+        "outer.memory.txt",
+        "outer.prof",
+        "summary.txt",
+    ]
+    assert pstats.Stats(os.path.join(directory, "outer.prof")).total_calls > 0
+
+    with open(os.path.join(directory, "summary.txt")) as f:
+        summary = f.read()
+    assert "outer" in summary
+    assert "inner" in summary and "nested, timed only" in summary
+    assert "top functions by cumulative time" in summary
+    assert "top net allocations" in summary
+
+
+def test_profiler__write_even_if_stage_fails(tmp_path):
+    directory = str(tmp_path)
+    profiling.enable(["cpu"], directory)
+    try:
+        with profiling.stage("failing"):
+            raise SystemExit(2)
+    except SystemExit:
+        pass
+    finally:
+        profiling.finish()
+
+    assert os.path.exists(os.path.join(directory, "failing.prof"))
+
+
+def test_profiler__memory_peak(tmp_path):
+    directory = str(tmp_path)
+    profiling.enable(["memory"], directory)
+    try:
+        with profiling.stage("spike"):
+            # Allocated and freed again, so the net allocations miss it.
+            assert len(bytearray(16 * 2 ** 20))
+    finally:
+        profiling.finish()
+
+    with open(os.path.join(directory, "summary.txt")) as f:
+        header, spike = f.read().splitlines()[:2]
+    assert header.split()[-2:] == ["peak", "MiB"]
+    assert spike.split()[0] == "spike"
+    assert float(spike.split()[-1]) >= 16
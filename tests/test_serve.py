@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+import uuid
+
+import pytest
+import requests
+
+from gdc_maf_tool import log, serve
+
+# Fail rather than hang if the server wedges.
+TIMEOUT = 5
+
+FAILED_DOWNLOAD = {"case_id": "c", "file_id": "f", "reason": "Not authorized"}
+
+
+@pytest.fixture
+def server():
+    ran = []
+
+    def runner(params):
+        if params["project_id"] == "EXIT":
+            raise SystemExit(2)
+        if params["project_id"] == "FATAL":
+            log.fatal("No MAF files found for FATAL.")
+        if params["project_id"] == "ALL_FAILED":
+            log.fatal("All 1 downloads failed", [FAILED_DOWNLOAD])
+        # The token is cleared from params once the job finishes.
+        ran.append(dict(params))
+        if params["project_id"] == "PARTIAL":
+            return [FAILED_DOWNLOAD]
+        return []
+
+    srv = serve.Server(runner, "127.0.0.1", 0)
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(srv.server_address[1]), ran
+    srv.shutdown()
+    thread.join()
+    srv.server_close()
+
+
+def wait_for(url, job_id):
+    for _ in range(100):
+        job = requests.get("{}/jobs/{}".format(url, job_id), timeout=TIMEOUT).json()
+        if job["status"] in (serve.SUCCEEDED, serve.FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("Job {} never finished".format(job_id))
+
+
+def test_serve__submit_job(server):
+    url, ran = server
+    file_ids = [str(uuid.uuid4())]
+    resp = requests.post(
+        url + "/jobs",
+        json={"file_ids": file_ids, "output": "out.maf.gz", "token": "secret"},  # nosec
+        timeout=TIMEOUT,
+    )
+    assert resp.status_code == 202
+    assert "token" not in resp.json()["params"]
+
+    job = wait_for(url, resp.json()["id"])
+    assert job["status"] == serve.SUCCEEDED
+    assert ran[0]["file_ids"] == file_ids
+    assert ran[0]["token"] == "secret"
+    assert ran[0]["output_filename"] == "out.maf.gz"
+    assert ran[0]["failed_downloads_filename"] == "out.failed-downloads.tsv"
+    assert job["failed_downloads"] == []
+
+
+def test_serve__job_reports_failures(server):
+    url, _ = server
+    fatal, all_failed, partial = [
+        requests.post(
+            url + "/jobs",
+            json={"project_id": project_id, "output": "a"},
+            timeout=TIMEOUT,
+        )
+        for project_id in ("FATAL", "ALL_FAILED", "PARTIAL")
+    ]
+
+    job = wait_for(url, fatal.json()["id"])
+    assert job["status"] == serve.FAILED
+    assert job["error"] == "No MAF files found for FATAL."
+
+    job = wait_for(url, all_failed.json()["id"])
+    assert job["status"] == serve.FAILED
+    assert job["failed_downloads"] == [FAILED_DOWNLOAD]
+
+    job = wait_for(url, partial.json()["id"])
+    assert job["status"] == serve.SUCCEEDED
+    assert job["failed_downloads"] == [FAILED_DOWNLOAD]
+
+
+def test_serve__fatal_job_does_not_stop_server(server):
+    url, ran = server
+    failed = requests.post(
+        url + "/jobs", json={"project_id": "EXIT", "output": "a"}, timeout=TIMEOUT
+    )
+    ok = requests.post(
+        url + "/jobs", json={"project_id": "TCGA-X", "output": "b"}, timeout=TIMEOUT
+    )
+
+    assert wait_for(url, failed.json()["id"])["status"] == serve.FAILED
+    assert wait_for(url, ok.json()["id"])["status"] == serve.SUCCEEDED
+    assert len(requests.get(url + "/jobs", timeout=TIMEOUT).json()) == 2
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"output": "out.maf.gz"},
+        {"project_id": "TCGA-X"},
+        {"project_id": "TCGA-X", "case_ids": ["a"], "output": "out.maf.gz"},
+        {"case_ids": "not-a-list", "output": "out.maf.gz"},
+        {"project_id": "TCGA-X", "output": "out.maf.gz", "extra": 1},
+        {"project_id": "TCGA-X", "output": 1},
+    ],
+)
+def test_serve__invalid_job(server, body):
+    url, ran = server
+    resp = requests.post(url + "/jobs", data=json.dumps(body), timeout=TIMEOUT)
+    assert resp.status_code == 400
+    assert not ran
+
+
+def test_serve__unknown_job(server):
+    url, _ = server
+    resp = requests.get("{}/jobs/{}".format(url, uuid.uuid4()), timeout=TIMEOUT)
+    assert resp.status_code == 404
+
+
+def test_job_queue__stop_cancels_queued_jobs():
+    started = threading.Event()
+    release = threading.Event()
+
+    def runner(params):
+        started.set()
+        assert release.wait(TIMEOUT)
+        return []
+
+    jobs = serve.JobQueue(runner)
+    jobs.start()
+    body = {"project_id": "TCGA-X", "output": "out.maf.gz", "token": "secret"}  # nosec
+    running, *queued = [jobs.submit(body) for _ in range(3)]
+    assert started.wait(TIMEOUT)
+
+    stop = threading.Thread(target=jobs.stop)
+    stop.start()
+    # Queued jobs are cancelled right away, the running one is finished.
+    for _ in range(100):
+        if all(job.status == serve.CANCELLED for job in queued):
+            break
+        time.sleep(0.01)
+    assert running.status == serve.RUNNING
+    release.set()
+    stop.join(TIMEOUT)
+
+    assert not stop.is_alive()
+    assert running.status == serve.SUCCEEDED
+    assert [job.status for job in queued] == [serve.CANCELLED] * 2
+    assert all(job.params["token"] is None for job in jobs.jobs())